@@ -1,11 +1,28 @@
-import logging, colorlog, os, traceback, base64
-from quart import Quart, request, send_file, Response, redirect
+import logging, colorlog, os, traceback, base64, asyncio
+import numpy as np
+from quart import Quart, request, Response, redirect
 from quart_cors import cors
 from time import time
 from dotenv import load_dotenv
 from models.Response import Response as ApiResponse
 from models.Request import Request as ApiRequest
 from models.Voice import Voice
+from models.Inference import Inference
+from models.Embedding import Embedding
+from models.Batcher import Batcher
+from models.Cache import Cache
+from models.Storage import Storage
+from models.Encoder import Encoder
+from models.Registry import Registry
+from models.Precision import Precision
+from models.Compiler import Compiler
+from models.Metrics import Metrics
+from models.Profiler import Profiler
+from models.Admission import Admission
+from models.Deadline import Deadline
+from models.Upload import Upload
+from models.Speakers import Speakers
+from models.SpeakerStore import SpeakerStore
 from init import initialize_globals
 
 load_dotenv()
@@ -23,12 +40,53 @@ DEVICE_V1 = os.getenv("DEVICE_V1", "cuda:0")
 DEVICE_V2 = os.getenv("DEVICE_V2", "cuda:0")
 SUPPORTED_STYLES_V1 = os.getenv("SUPPORTED_STYLES_V1", "English").split(",")
 USE_VAD = os.getenv("USE_VAD", False)
-OPENVOICE_PATH = "/app/OpenVoice"
+INFERENCE_WORKERS = os.getenv("INFERENCE_WORKERS", "2")
+INFERENCE_MAX_IN_FLIGHT = os.getenv("INFERENCE_MAX_IN_FLIGHT", "1")
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", 1))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", 10))
+RESULT_CACHE_MEMORY_MB = float(os.getenv("RESULT_CACHE_MEMORY_MB", 256))
+RESULT_CACHE_DISK_MB = float(os.getenv("RESULT_CACHE_DISK_MB", 1024))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "cache/results")
+AUDIO_FILES_MAX_MB = float(os.getenv("AUDIO_FILES_MAX_MB", 1024))
+AUDIO_FILES_TTL = float(os.getenv("AUDIO_FILES_TTL", 3600))
+AUDIO_FILES_CLEANUP_INTERVAL = float(os.getenv("AUDIO_FILES_CLEANUP_INTERVAL", 60))
+AUDIO_FILES_MAX_AGE = int(os.getenv("AUDIO_FILES_MAX_AGE", 31536000))
+AUDIO_FILES_SENDFILE_HEADER = os.getenv("AUDIO_FILES_SENDFILE_HEADER", "")
+AUDIO_FILES_SENDFILE_PREFIX = os.getenv("AUDIO_FILES_SENDFILE_PREFIX", "/audio-files/")
+AUDIO_FILES_SENDFILE_MIN_MB = float(os.getenv("AUDIO_FILES_SENDFILE_MIN_MB", 1))
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+PROFILE_PATH = os.getenv("PROFILE_PATH", "cache/profiles")
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+ADMISSION_MAX_CONCURRENCY = os.getenv("ADMISSION_MAX_CONCURRENCY", "4")
+ADMISSION_MAX_QUEUE = os.getenv("ADMISSION_MAX_QUEUE", "16")
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30))
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 120))
+REQUEST_MAX_TIMEOUT = float(os.getenv("REQUEST_MAX_TIMEOUT", 600))
+UPLOAD_MAX_MB = float(os.getenv("UPLOAD_MAX_MB", 50))
+UPLOAD_SPOOL_MB = float(os.getenv("UPLOAD_SPOOL_MB", 1))
+UPLOAD_SE_CACHE_SIZE = int(os.getenv("UPLOAD_SE_CACHE_SIZE", 1024))
+CONVERSION_WINDOW = float(os.getenv("CONVERSION_WINDOW", 30))
+CONVERSION_OVERLAP = float(os.getenv("CONVERSION_OVERLAP", 0.5))
+CONVERSION_PARALLEL_WINDOWS = int(os.getenv("CONVERSION_PARALLEL_WINDOWS", 2))
+VOICES_PATH = os.getenv("VOICES_PATH", "voices")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+SPEAKER_STORE_PATH = os.getenv("SPEAKER_STORE_PATH", "cache/speakers")
+SPEAKER_HOT_VOICES = int(os.getenv("SPEAKER_HOT_VOICES", 256))
+WARMUP = str(os.getenv("WARMUP", "true")).lower() in ("true", "1")
+WARMUP_TEXT = os.getenv("WARMUP_TEXT", "")
+OPENVOICE_PATH = os.getenv("OPENVOICE_PATH", "/app/OpenVoice")
 BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
 
 # Initialize Quart app
 app = Quart(__name__)
 app = cors(app, allow_origin="*")
+# Bodies over the upload limit (with room for base64 in json) are refused while being received
+app.config["MAX_CONTENT_LENGTH"] = int(UPLOAD_MAX_MB * 1024 * 1024 * 4 / 3) + 64 * 1024
+# Quart cuts bodies off after 60s by default, streamed audio and large uploads may take
+# as long as the longest request deadline
+app.config["RESPONSE_TIMEOUT"] = REQUEST_MAX_TIMEOUT if REQUEST_MAX_TIMEOUT > 0 else None
+app.config["BODY_TIMEOUT"] = REQUEST_MAX_TIMEOUT if REQUEST_MAX_TIMEOUT > 0 else None
 
 # Configure colored logging
 handler = colorlog.StreamHandler()
@@ -66,13 +124,14 @@ globals_data = initialize_globals(
     reference_speakers,
     targets_v2,
     targets_v1,
-    models,
     speaker_ids,
     ckpt_base,
-    base_speaker_tts,
     tone_color_converter_v1,
     tone_color_converter_v2,
     STYLES_V1,
+    source_ses,
+    SE_CACHE_PATH,
+    checkpoint_hashes,
 ) = globals_data
 
 Voice.set_vars(
@@ -80,22 +139,95 @@ Voice.set_vars(
     MODEL_LANGUAGES_NAMES_V1,
     speaker_ids,
     OPENVOICE_PATH,
-    models,
     ckpt_base,
-    base_speaker_tts,
     WATERMARK,
+    CONVERSION_WINDOW,
+    CONVERSION_OVERLAP,
+    CONVERSION_PARALLEL_WINDOWS,
 )
+Embedding.set_vars(
+    logger,
+    source_ses,
+    OPENVOICE_PATH,
+    ckpt_base,
+    {"v1": DEVICE_V1, "v2": DEVICE_V2},
+    SE_CACHE_PATH,
+    checkpoint_hashes,
+    USE_VAD,
+    UPLOAD_SE_CACHE_SIZE,
+)
+Inference.set_vars(
+    logger,
+    Inference.parse_limits(INFERENCE_WORKERS, 2),
+    Inference.parse_limits(INFERENCE_MAX_IN_FLIGHT, 1),
+)
+Batcher.set_vars(logger, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS / 1000)
+Cache.set_vars(
+    logger,
+    int(RESULT_CACHE_MEMORY_MB * 1024 * 1024),
+    RESULT_CACHE_PATH,
+    int(RESULT_CACHE_DISK_MB * 1024 * 1024),
+)
+Storage.set_vars(
+    logger,
+    AUDIO_FILES_PATH,
+    int(AUDIO_FILES_MAX_MB * 1024 * 1024),
+    AUDIO_FILES_TTL,
+    AUDIO_FILES_CLEANUP_INTERVAL,
+)
+Encoder.set_vars(logger, FFMPEG_PATH)
+Metrics.set_vars(logger)
+Profiler.set_vars(logger, PROFILE_PATH, PROFILE_TOKEN, PROFILE_SAMPLE_RATE)
+Admission.set_vars(
+    logger,
+    Inference.parse_limits(ADMISSION_MAX_CONCURRENCY, 4),
+    Inference.parse_limits(ADMISSION_MAX_QUEUE, 16),
+    ADMISSION_QUEUE_TIMEOUT,
+)
+Deadline.set_vars(logger, REQUEST_TIMEOUT, REQUEST_MAX_TIMEOUT)
 ApiRequest.set_vars(
-    models,
     MODEL_LANGUAGES_CODES_V1,
     MODEL_LANGUAGES_V2,
-    SPEAKERS,
+    set(reference_speakers),
     MODEL_LANGUAGES_NAMES_V1,
     STYLES_V1,
     SUPPORTED_STYLES_V1,
     speaker_ids,
     reference_speakers,
+    int(UPLOAD_MAX_MB * 1024 * 1024),
+)
+# The SEs of SPEAKERS extracted at startup join the registered ones in the packed store,
+# requests read them from there
+SpeakerStore.set_vars(
+    logger,
+    SPEAKER_STORE_PATH,
+    {"v1": DEVICE_V1, "v2": DEVICE_V2},
+    SPEAKER_HOT_VOICES,
+)
+if tone_color_converter_v1:
+    SpeakerStore.put("v1", targets_v1)
+if tone_color_converter_v2:
+    SpeakerStore.put("v2", targets_v2)
+# Only the hot voices stay on the device from now on
+del targets_v1, targets_v2, globals_data
+Speakers.set_vars(
+    logger,
+    VOICES_PATH,
+    ADMIN_TOKEN,
+    {"v1": tone_color_converter_v1, "v2": tone_color_converter_v2},
+    ApiRequest.speakers,
+    reference_speakers,
 )
+Speakers.load()
+
+
+@app.before_request
+async def start_request():
+    # Must be async: Quart runs sync hooks in a copy of the context, so the context
+    # variables they set are never seen by the handler
+    Metrics.start_request()
+    Deadline.start(request.headers)
+    Profiler.start(request.headers)
 
 
 @app.before_request
@@ -108,17 +240,48 @@ def log_request_info():
     request.start_time = time()
 
 
+@app.before_request
+async def refresh_voices():
+    await Speakers.refresh()
+
+
 @app.after_request
 def add_header(response):
     if hasattr(request, "start_time"):
         elapsed_time = time() - request.start_time
         response.headers["X-Elapsed-Time"] = str(elapsed_time)
-        response.headers["Access-Control-Expose-Headers"] = "X-Elapsed-Time"
+        response.headers["Access-Control-Expose-Headers"] = (
+            "X-Elapsed-Time, Server-Timing, X-Profile-Id, X-Profile-Files"
+        )
+    server_timing = Metrics.server_timing()
+    if server_timing:
+        response.headers["Server-Timing"] = server_timing
+    response.headers.update(Profiler.headers())
+    Metrics.finish(request.endpoint or "", response.status_code)
     return response
 
 
+warmup_state = {"ready": False, "seconds": None}
+
+
+@app.before_serving
+async def start_storage():
+    Storage.start()
+    if WARMUP:
+        app.add_background_task(warmup)
+    else:
+        warmup_state["ready"] = True
+
+
+@app.after_serving
+async def shutdown_inference():
+    Storage.stop()
+    Inference.shutdown()
+
+
 @app.teardown_request
 def log_teardown(exception=None):
+    Metrics.end_request()
     if exception:
         logger.error(f"Exception occurred: {exception}")
     logger.debug(
@@ -137,39 +300,74 @@ async def home():
             "device_v2": DEVICE_V2,
             "models_v1": MODEL_LANGUAGES_V1,
             "models_v2": MODEL_LANGUAGES_V2,
+            "result_cache": Cache.stats(),
+            "audio_files": Storage.stats(),
+            "loaded_models": Registry.stats(),
+            "precision": Precision.stats(),
+            "converter_backends": Compiler.stats(),
+            "admission": Admission.stats(),
+            "speaker_store": SpeakerStore.stats(),
         },
     )
     return await ApiResponse.output(payload_response, 200)
 
 
+async def read_upload():
+
+    # Audio comes as base64 in json, as a multipart "audio_data" file with the other
+    # params as fields, or as a raw audio body with the params in the query string.
+    # Returns the params, the upload (None for json) and an error payload
+    content_type = request.mimetype
+    too_large = ApiResponse.payload(False, 413, "Request body too large")
+
+    if request.content_length is not None and request.content_length > app.config["MAX_CONTENT_LENGTH"]:
+        return None, None, too_large
+
+    if content_type == "multipart/form-data":
+        args = (await request.form).to_dict()
+        file = (await request.files).get("audio_data")
+        upload = None
+
+        if file is not None:
+            loop = asyncio.get_running_loop()
+            upload = await loop.run_in_executor(None, Upload.from_file, file.stream)
+
+        return args, upload, None
+
+    if content_type.startswith("audio/") or content_type == "application/octet-stream":
+        upload = await Upload.from_stream(
+            request.body,
+            int(UPLOAD_MAX_MB * 1024 * 1024),
+            int(UPLOAD_SPOOL_MB * 1024 * 1024),
+        )
+        return request.args.to_dict(), upload, None if upload else too_large
+
+    return dict(await request.get_json()), None, None
+
+
 @app.route("/<version>/change-voice", methods=["POST"])
 async def change_voice(version):
 
-    args = dict(await request.get_json())
-    validation_result = await ApiRequest.validate_change_voice_request(args)
+    args, upload, error = await read_upload()
 
-    if validation_result:
-        app.logger.debug(f" > Validator error: {validation_result}")
-        return await ApiResponse.output(validation_result, validation_result["code"])
+    if error:
+        return await ApiResponse.output(error, error["code"])
 
     try:
-        audio_bytes = args.pop("audio_bytes")
-        file_extension = args.pop("file_extension")
-        output_filename = Voice.generate_random_filename("", file_extension)
-        output_file = f"{AUDIO_FILES_PATH}/{output_filename}"
-        with open(output_file, "wb") as audio_file:
-            audio_file.write(audio_bytes)
+        with Metrics.stage("validation"):
+            validation_result = await ApiRequest.validate_change_voice_request(args, upload)
 
-    except Exception as e:
-        app.logger.error(f" > Error: {str(e)}")
+        if validation_result:
+            app.logger.debug(f" > Validator error: {validation_result}")
+            return await ApiResponse.output(validation_result, validation_result["code"])
 
-        if LOG_LEVEL == "DEBUG":
-            app.logger.error(traceback.format_exc())
+        upload = args.pop("audio")
+        args.pop("file_extension")
+        return await generate_audio(version, args, upload)
 
-        payload_response = ApiResponse.payload(False, 500, "Internal Server Error")
-        return await ApiResponse.output(payload_response, 500)
-
-    return await generate_audio(version, args, output_file)
+    finally:
+        if upload is not None:
+            upload.close()
 
 
 # OpenAI SDK adaptation
@@ -177,24 +375,27 @@ async def change_voice(version):
 async def generate_audio_openai(version):
 
     args = dict(await request.get_json())
-    validation_result = await ApiRequest.validate_generate_audio_request(
-        args, version, True
-    )
+    with Metrics.stage("validation"):
+        validation_result = await ApiRequest.validate_generate_audio_request(
+            args, version, True
+        )
 
     if validation_result:
         app.logger.debug(f" > Validator error: {validation_result}")
         return await ApiResponse.output(validation_result, validation_result["code"])
 
+    args["audio_format"] = args["response_format"].lower()
     args["response_format"] = "stream"
     return await generate_audio(version, args)
 
 
 @app.route("/<version>/generate-audio", methods=["POST"])
-async def generate_audio(version, args=None, source_file=None):
+async def generate_audio(version, args=None, source_audio=None):
 
     if args is None:
         args = dict(await request.get_json())
-    validation_result = await ApiRequest.validate_generate_audio_request(args, version)
+    with Metrics.stage("validation"):
+        validation_result = await ApiRequest.validate_generate_audio_request(args, version)
 
     if validation_result:
         app.logger.debug(f" > Validator error: {validation_result}")
@@ -203,78 +404,101 @@ async def generate_audio(version, args=None, source_file=None):
     try:
 
         if version == "v1":
-            validation_result = await ApiRequest.validate_generate_audio_v1_params(args)
-
-            if validation_result:
-                app.logger.debug(f" > Validator error: {validation_result}")
-                return await ApiResponse.output(
-                    validation_result, validation_result["code"]
-                )
-
-            if source_file:
-                source_se = await Voice.build_source_se(args, version, DEVICE_V1)
-                prev_output_file = source_file
-            else:
-                output_filename = Voice.generate_random_filename("", "wav")
-                output_file = f"{AUDIO_FILES_PATH}/{output_filename}"
-                source_se = await Voice.tts_v1(args, output_file, DEVICE_V1)
-                prev_output_file = output_file
-
-            speaker = args.get("voice").lower()
-
-            if speaker != "raw":
-                app.logger.debug(f" > Running v1 color converter...")
-                output_filename = Voice.generate_random_filename("", "wav")
-                output_file = f"{AUDIO_FILES_PATH}/{output_filename}"
-                await Voice.convert(
-                    src_file=prev_output_file,
-                    output_file=output_file,
-                    src_se=source_se,
-                    tgt_se=targets_v1[speaker],
-                    converter=tone_color_converter_v1,
-                )
+            with Metrics.stage("validation"):
+                validation_result = await ApiRequest.validate_generate_audio_v1_params(args)
 
         elif version == "v2":
-            validation_result = await ApiRequest.validate_generate_audio_v2_params(args)
-
-            if validation_result:
-                app.logger.debug(f" > Validator error: {validation_result}")
-                return await ApiResponse.output(
-                    validation_result, validation_result["code"]
-                )
+            with Metrics.stage("validation"):
+                validation_result = await ApiRequest.validate_generate_audio_v2_params(args)
 
-            if source_file:
-                source_se = await Voice.build_source_se(args, version, DEVICE_V2)
-                prev_output_file = source_file
-            else:
-                output_filename = Voice.generate_random_filename("", "wav")
-                output_file = f"{AUDIO_FILES_PATH}/{output_filename}"
-                source_se = await Voice.tts_v2(args, output_file, DEVICE_V2)
-                prev_output_file = output_file
-
-            speaker = args.get("voice").lower()
-
-            if speaker != "raw":
-                app.logger.debug(f" > Running v2 color converter...")
-                output_filename = Voice.generate_random_filename("", "wav")
-                output_file = f"{AUDIO_FILES_PATH}/{output_filename}"
-                await Voice.convert(
-                    src_file=prev_output_file,
-                    output_file=output_file,
-                    src_se=source_se,
-                    tgt_se=targets_v2[speaker],
-                    converter=tone_color_converter_v2,
-                )
         else:
             error_message = f" > Version {version} not supported"
             app.logger.error(error_message)
             payload_response = ApiResponse.payload(False, 400, error_message)
             return await ApiResponse.output(payload_response, 400)
 
+        if validation_result:
+            app.logger.debug(f" > Validator error: {validation_result}")
+            return await ApiResponse.output(
+                validation_result, validation_result["code"]
+            )
+
         raw_response_format = args.get("response_format")
         response_format = raw_response_format.lower()
+        audio_format = args.get("audio_format").lower()
+        mimetype = Encoder.mimetype(audio_format)
+        Metrics.label(
+            version=version,
+            language=args.get("model").upper(),
+            voice=args.get("voice").lower(),
+            response_format=response_format,
+        )
+        admission_key = f"{version}:{args.get('model').upper()}"
+        cache_key = Cache.key(version, args, source_audio) if Cache.enabled() else None
+        # Only requests that run inference take a slot, cache hits and requests waiting on an
+        # identical one do not (streams never wait on another request)
+        admitted = not (cache_key and Cache.contains(cache_key, inflight=response_format != "stream"))
+
+        if admitted:
+            # A request already past its deadline gets 504 rather than a queue timeout
+            Deadline.check()
+            rejection = await Admission.acquire(admission_key, Deadline.remaining())
+
+            if rejection:
+                app.logger.warning(f" > Request shed: {rejection['result']['message']}")
+                response = await ApiResponse.output(rejection, rejection["code"])
+                response.headers["Retry-After"] = str(rejection["result"]["data"]["retry_after"])
+                return response
+
+        if response_format == "stream":
+
+            if source_audio:
+                # The upload is decoded before the response starts, it is closed once the handler
+                # returns. A cached result does not need it
+                try:
+                    cached = await Cache.get(cache_key) if cache_key else None
+                    segments = convert_stream(
+                        version,
+                        args,
+                        cache_key,
+                        cached,
+                        *(await Deadline.wait(load_source(version, args, source_audio)) if cached is None else (None, None, None)),
+                    )
+                except BaseException:
+                    if admitted:
+                        Admission.release(admission_key)
+                    raise
+            else:
+                segments = synthesize_stream(version, args, cache_key)
+
+            body = Encoder.encode_stream(audio_format, segments)
+            return Response(
+                Admission.hold(admission_key, body) if admitted else body,
+                mimetype=mimetype,
+            )
+
+        try:
+            if cache_key:
+                audio, sampling_rate = await Deadline.wait(
+                    Cache.get_or_create(
+                        cache_key,
+                        lambda: synthesize(version, args, source_audio),
+                    )
+                )
+            else:
+                audio, sampling_rate = await Deadline.wait(
+                    synthesize(version, args, source_audio)
+                )
+        finally:
+            if admitted:
+                Admission.release(admission_key)
 
         if response_format == "url":
+            with Metrics.stage("encoding"):
+                audio_bytes = await Encoder.encode_async(audio, sampling_rate, audio_format)
+            output_filename = Voice.generate_random_filename("", audio_format)
+            with Metrics.stage("file_io"):
+                await Storage.save(output_filename, audio_bytes)
             protocol = request.scheme
             host = request.host
             output_url = f"{protocol}://{host}/audio-file/{output_filename}"
@@ -284,15 +508,13 @@ async def generate_audio(version, args=None, source_file=None):
             return await ApiResponse.output(payload_response, 200)
 
         elif response_format == "bytes":
-            output_path = f"{AUDIO_FILES_PATH}/{output_filename}"
-            with open(output_path, "rb") as audio_file:
-                audio_bytes = audio_file.read()
-            return Response(audio_bytes, mimetype="audio/wav")
+            with Metrics.stage("encoding"):
+                audio_bytes = await Encoder.encode_async(audio, sampling_rate, audio_format)
+            return Response(audio_bytes, mimetype=mimetype)
 
         elif response_format == "base64":
-            output_path = f"{AUDIO_FILES_PATH}/{output_filename}"
-            with open(output_path, "rb") as audio_file:
-                audio_bytes = audio_file.read()
+            with Metrics.stage("encoding"):
+                audio_bytes = await Encoder.encode_async(audio, sampling_rate, audio_format)
             audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
             payload_response = ApiResponse.payload(
                 True,
@@ -302,24 +524,24 @@ async def generate_audio(version, args=None, source_file=None):
             )
             return await ApiResponse.output(payload_response, 200)
 
-        elif response_format == "stream":
-            output_path = f"{AUDIO_FILES_PATH}/{output_filename}"
-
-            async def generate():
-                with open(output_path, "rb") as fwav:
-                    data = fwav.read(1024)
-                    while data:
-                        yield data
-                        data = fwav.read(1024)
-
-            return Response(generate(), mimetype="audio/wav")
-
         else:
             payload_response = ApiResponse.payload(
                 False, 400, f"Invalid response_format parameter: {raw_response_format}"
             )
             return await ApiResponse.output(payload_response, 400)
 
+    except asyncio.TimeoutError:
+        app.logger.warning(" > Request deadline exceeded, synthesis cancelled")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="deadline")
+        payload_response = ApiResponse.payload(False, 504, "Request deadline exceeded")
+        return await ApiResponse.output(payload_response, 504)
+
+    except asyncio.CancelledError:
+        # The client went away, queued inference is dropped with the task
+        app.logger.debug(" > Client disconnected, synthesis cancelled")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="disconnect")
+        raise
+
     except Exception as e:
         app.logger.error(f" > Error: {str(e)}")
 
@@ -330,7 +552,264 @@ async def generate_audio(version, args=None, source_file=None):
         return await ApiResponse.output(payload_response, 500)
 
 
-@app.route("/audio-file/<filename>", methods=["GET"])
+def get_models(version):
+
+    if version == "v1":
+        return DEVICE_V1, tone_color_converter_v1
+
+    return DEVICE_V2, tone_color_converter_v2
+
+
+async def load_source(version, args, source_audio):
+
+    device, converter = get_models(version)
+    source_se = await Voice.build_upload_se(args, source_audio, converter, version, device)
+    audio, sampling_rate = await Voice.load_audio(source_audio, converter)
+    return audio, sampling_rate, source_se
+
+
+async def synthesize(version, args, source_audio=None):
+
+    device, converter = get_models(version)
+
+    if source_audio:
+        audio, sampling_rate, source_se = await load_source(version, args, source_audio)
+    elif version == "v1":
+        audio, sampling_rate, source_se = await Voice.tts_v1(args, device)
+    else:
+        audio, sampling_rate, source_se = await Voice.tts_v2(args, device)
+
+    speaker = args.get("voice").lower()
+
+    if speaker != "raw":
+        # Do not start the conversion of a request that is already late
+        Deadline.check()
+        app.logger.debug(f" > Running {version} color converter...")
+        audio, sampling_rate = await Voice.convert(
+            audio=audio,
+            sampling_rate=sampling_rate,
+            src_se=source_se,
+            tgt_se=SpeakerStore.get(version, speaker),
+            converter=converter,
+            version=version,
+        )
+
+    return audio, sampling_rate
+
+
+async def synthesize_stream(version, args, cache_key=None):
+
+    # Yield each sentence as soon as it has been synthesized and converted,
+    # the encoder stage turns the segments into the requested audio format
+    segments = []
+
+    try:
+        cached = await Cache.get(cache_key) if cache_key else None
+
+        if cached is not None:
+            yield cached
+            return
+
+        for text in await Voice.split_text(version, args):
+            Deadline.check()
+            audio, sampling_rate = await synthesize(version, dict(args, input=text))
+            segments.append(audio)
+            yield audio, sampling_rate
+
+        if cache_key and segments:
+            await Cache.set(cache_key, (np.concatenate(segments), sampling_rate))
+
+    except asyncio.TimeoutError:
+        app.logger.warning(" > Request deadline exceeded, stream stopped")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="deadline")
+
+    except (asyncio.CancelledError, GeneratorExit):
+        app.logger.debug(" > Client disconnected, stream stopped")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="disconnect")
+        raise
+
+    except Exception as e:
+        app.logger.error(f" > Error while streaming audio: {str(e)}")
+
+        if LOG_LEVEL == "DEBUG":
+            app.logger.error(traceback.format_exc())
+
+
+async def convert_stream(version, args, cache_key, cached, audio, sampling_rate, source_se):
+
+    # Yield the windows of an uploaded clip as soon as they are converted, cached is the
+    # result already looked up in the cache, the audio is None when it is set
+    device, converter = get_models(version)
+    speaker = args.get("voice").lower()
+    segments = []
+
+    try:
+        if cached is not None:
+            yield cached
+            return
+
+        if speaker == "raw":
+            segments.append(audio)
+            yield audio, sampling_rate
+        elif not Voice.windowed(audio, sampling_rate):
+            Deadline.check()
+            audio, sampling_rate = await Voice.convert(audio, sampling_rate, source_se, SpeakerStore.get(version, speaker), converter, version)
+            segments.append(audio)
+            yield audio, sampling_rate
+        else:
+            windows = Voice.convert_windows(audio, sampling_rate, source_se, SpeakerStore.get(version, speaker), converter, version)
+            sampling_rate = converter.hps.data.sampling_rate
+
+            try:
+                async for chunk in windows:
+                    Deadline.check()
+                    segments.append(chunk)
+                    yield chunk, sampling_rate
+            finally:
+                # Cancels the windows still converting when the stream stops early
+                await windows.aclose()
+
+        if cache_key and segments:
+            await Cache.set(cache_key, (np.concatenate(segments), sampling_rate))
+
+    except asyncio.TimeoutError:
+        app.logger.warning(" > Request deadline exceeded, stream stopped")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="deadline")
+
+    except (asyncio.CancelledError, GeneratorExit):
+        app.logger.debug(" > Client disconnected, stream stopped")
+        Metrics.inc("openvoice_cancelled_requests_total", reason="disconnect")
+        raise
+
+    except Exception as e:
+        app.logger.error(f" > Error while streaming audio: {str(e)}")
+
+        if LOG_LEVEL == "DEBUG":
+            app.logger.error(traceback.format_exc())
+
+
+async def warmup():
+
+    # Runs every loaded model once per accent and converts the result to every voice set in
+    # SPEAKERS, so the first real requests do not pay for lazy initialization
+    start_time = time()
+
+    for model in Registry.stats()["loaded"]:
+        version, language = model.split(":")
+        text = WARMUP_TEXT or Precision.sample_texts.get(language, Precision.sample_texts["EN"])
+
+        if version == "v1":
+            device, converter = DEVICE_V1, tone_color_converter_v1
+            accents = ["default"]
+        else:
+            device, converter = DEVICE_V2, tone_color_converter_v2
+            accents = [speaker_key.lower() for speaker_key in speaker_ids[language]]
+
+        for accent in accents:
+            args = {"model": language.lower(), "input": text, "speed": 1.0, "voice": "raw"}
+
+            try:
+                accent_start_time = time()
+
+                if version == "v1":
+                    audio, sampling_rate, source_se = await Voice.tts_v1(dict(args, style="default"), device)
+                else:
+                    audio, sampling_rate, source_se = await Voice.tts_v2(dict(args, accent=accent), device)
+
+                for speaker in sorted(Speakers.builtin):
+                    await Voice.convert(
+                        audio=audio,
+                        sampling_rate=sampling_rate,
+                        src_se=source_se,
+                        tgt_se=SpeakerStore.get(version, speaker),
+                        converter=converter,
+                        version=version,
+                    )
+
+                logger.info(f" > Warmed up {model}/{accent} in {time() - accent_start_time:.2f}s")
+
+            except Exception as e:
+                logger.warning(f" > Warmup failed for {model}/{accent}: {str(e)}")
+
+    warmup_state["seconds"] = time() - start_time
+    warmup_state["ready"] = True
+    logger.info(f" > Warmup finished in {warmup_state['seconds']:.2f}s")
+
+
+@app.route("/admin/voices", methods=["GET"])
+async def list_voices():
+    if not Speakers.authorized(request.headers):
+        return await ApiResponse.output(ApiResponse.payload(False, 401, "Unauthorized"), 401)
+
+    payload_response = ApiResponse.payload(True, 200, "Voices", {"voices": Speakers.voices()})
+    return await ApiResponse.output(payload_response, 200)
+
+
+@app.route("/admin/voices", methods=["POST"])
+async def register_voice():
+    if not Speakers.authorized(request.headers):
+        return await ApiResponse.output(ApiResponse.payload(False, 401, "Unauthorized"), 401)
+
+    args, upload, error = await read_upload()
+
+    if error:
+        return await ApiResponse.output(error, error["code"])
+
+    try:
+        validation_result = await ApiRequest.validate_register_voice_request(args, upload)
+
+        if validation_result:
+            app.logger.debug(f" > Validator error: {validation_result}")
+            return await ApiResponse.output(validation_result, validation_result["code"])
+
+        payload_response = await Speakers.register(args["name"], args["audio"])
+        return await ApiResponse.output(payload_response, payload_response["code"])
+
+    except Exception as e:
+        app.logger.error(f" > Error while registering voice: {str(e)}")
+
+        if LOG_LEVEL == "DEBUG":
+            app.logger.error(traceback.format_exc())
+
+        payload_response = ApiResponse.payload(False, 500, "Internal Server Error")
+        return await ApiResponse.output(payload_response, 500)
+
+    finally:
+        if upload is not None:
+            upload.close()
+
+
+@app.route("/admin/voices/<name>", methods=["DELETE"])
+async def delete_voice(name):
+    if not Speakers.authorized(request.headers):
+        return await ApiResponse.output(ApiResponse.payload(False, 401, "Unauthorized"), 401)
+
+    payload_response = await Speakers.delete(name.lower())
+    return await ApiResponse.output(payload_response, payload_response["code"])
+
+
+@app.route("/live")
+async def live():
+    payload_response = ApiResponse.payload(True, 200, "Alive")
+    return await ApiResponse.output(payload_response, 200)
+
+
+@app.route("/ready")
+async def ready():
+    if not warmup_state["ready"]:
+        payload_response = ApiResponse.payload(False, 503, "Warming up")
+        return await ApiResponse.output(payload_response, 503)
+
+    payload_response = ApiResponse.payload(True, 200, "Ready", warmup_state)
+    return await ApiResponse.output(payload_response, 200)
+
+
+@app.route("/metrics")
+async def metrics():
+    return Response(Metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/audio-file/<filename>", methods=["GET", "HEAD"])
 async def serve_audio(filename):
 
     try:
@@ -340,13 +819,36 @@ async def serve_audio(filename):
             payload_response = ApiResponse.payload(False, 404, "Audio file not found")
             return await ApiResponse.output(payload_response, 404)
 
-        stream_param = request.args.get("stream", False)
+        Storage.touch(filename)
+        stream_param = str(request.args.get("stream", "false")).lower()
 
-        if stream_param == True:
+        if stream_param in ("true", "1"):
             return await stream_audio(audio_file_path)
 
+        # Output names are unique and never rewritten, so clients and CDNs can keep them
+        if Storage.is_managed(filename):
+            cache_control = f"public, max-age={AUDIO_FILES_MAX_AGE}, immutable"
         else:
-            return await send_file(audio_file_path, mimetype="audio/wav")
+            cache_control = "no-cache"
+
+        sendfile_header = None
+        sendfile_path = None
+
+        if AUDIO_FILES_SENDFILE_HEADER:
+            file_size = os.path.getsize(audio_file_path)
+
+            if file_size >= AUDIO_FILES_SENDFILE_MIN_MB * 1024 * 1024:
+                sendfile_header = AUDIO_FILES_SENDFILE_HEADER
+                sendfile_path = f"{AUDIO_FILES_SENDFILE_PREFIX}{filename}"
+
+        return await ApiResponse.send_file(
+            request,
+            audio_file_path,
+            Encoder.mimetype_for_file(filename),
+            cache_control,
+            sendfile_header,
+            sendfile_path,
+        )
 
     except Exception as e:
         error_message = f" > An error occurred while serving audio: {e}"
@@ -359,14 +861,11 @@ async def stream_audio(file_path):
 
     try:
 
-        async def generate():
-            with open(file_path, "rb") as fwav:
-                data = fwav.read(1024)
-                while data:
-                    yield data
-                    data = fwav.read(1024)
-
-        return Response(generate(), mimetype="audio/wav")
+        file_size = os.path.getsize(file_path)
+        return Response(
+            ApiResponse.read_file(file_path, 0, file_size),
+            mimetype=Encoder.mimetype_for_file(file_path),
+        )
 
     except FileNotFoundError:
         payload_response = ApiResponse.payload(False, 404, "Audio file not found")
@@ -0,0 +1,302 @@
+"""
+Benchmarks the HTTP API in process with the stub models from stubs.py.
+
+    python benchmarks/run.py                     # run and compare with benchmarks/baseline.json
+    python benchmarks/run.py --save-baseline     # run and store the results as the new baseline
+    python benchmarks/run.py --no-compare        # only print the results
+
+Exits with status 1 when a p95 latency or a throughput is worse than the baseline
+by more than --tolerance, or when there is no baseline to compare with.
+"""
+import os, sys, io, json, time, base64, asyncio, argparse, tempfile
+
+BENCHMARKS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(BENCHMARKS_DIRECTORY, '../')))
+
+import numpy as np
+import soundfile
+import stubs
+
+TEXT = "Let me know how you feel, we might just have a deal. The weather is nice today, shall we go for a walk?"
+RESPONSE_FORMATS = ['url', 'bytes', 'base64', 'stream']
+SCENARIOS = ['v1_generate', 'v2_generate', 'v2_openai', 'v1_change_voice', 'audio_file']
+
+
+def configure(work_path):
+
+    # Everything the app writes goes to a temporary directory, and the result
+    # cache is off so every request runs the full pipeline
+    openvoice_path = f'{work_path}/OpenVoice'
+    stubs.create_checkpoints(openvoice_path, ['EN'], ['EN'])
+    os.makedirs(f'{work_path}/audio', exist_ok=True)
+
+    os.environ.update({
+        'LOG_LEVEL': 'WARNING',
+        'OPENVOICE_PATH': openvoice_path,
+        'AUDIO_FILES_PATH': f'{work_path}/audio',
+        'MODEL_LANGUAGES_V1': 'EN:English',
+        'MODEL_LANGUAGES_V2': 'EN',
+        'SPEAKERS_FOLDER': 'speakers',
+        'SPEAKERS': 'elon',
+        'DEVICE_V1': 'cpu',
+        'DEVICE_V2': 'cpu',
+        'SE_CACHE_PATH': f'{work_path}/cache/se',
+        'CONVERTER_CACHE_PATH': f'{work_path}/cache/converter',
+        'RESULT_CACHE_PATH': f'{work_path}/cache/results',
+        'VOICES_PATH': f'{work_path}/voices',
+        'SPEAKER_STORE_PATH': f'{work_path}/cache/speakers',
+        'RESULT_CACHE_MEMORY_MB': '0',
+        'RESULT_CACHE_DISK_MB': '0',
+        'BATCH_MAX_SIZE': '1',
+    })
+
+
+def sample_audio(seconds=3.0):
+
+    buffer = io.BytesIO()
+    soundfile.write(buffer, stubs.sine(int(seconds * stubs.SAMPLING_RATE)), stubs.SAMPLING_RATE, format='WAV', subtype='PCM_16')
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+def wav_duration(data):
+
+    # Reads the sample rate from the header and counts the 16-bit mono samples after it,
+    # which also works for the open ended header of streamed responses
+    if len(data) < 44 or data[:4] != b'RIFF':
+        return None
+
+    sampling_rate = int.from_bytes(data[24:28], 'little')
+    return (len(data) - 44) / 2 / sampling_rate
+
+
+def requests_for(scenario, response_format):
+
+    if scenario == 'v1_generate':
+        return 'POST', '/v1/generate-audio', {'model': 'en', 'input': TEXT, 'voice': 'elon', 'style': 'default', 'response_format': response_format}
+
+    if scenario == 'v2_generate':
+        return 'POST', '/v2/generate-audio', {'model': 'en', 'input': TEXT, 'voice': 'elon', 'accent': 'en-us', 'response_format': response_format}
+
+    if scenario == 'v2_openai':
+        return 'POST', '/v2/audio/speech', {'model': 'en', 'input': TEXT, 'voice': 'elon', 'response_format': 'wav'}
+
+    if scenario == 'v1_change_voice':
+        return 'POST', '/v1/change-voice', {'model': 'en', 'voice': 'elon', 'audio_data': sample_audio(), 'response_format': response_format}
+
+
+async def send(client, method, path, payload=None):
+
+    # Returns (status, time to first byte, total time, body)
+    start = time.perf_counter()
+    body = json.dumps(payload).encode('utf-8') if payload is not None else b''
+
+    async with client.request(path, method=method, headers={'Content-Type': 'application/json'}) as connection:
+        await connection.send(body)
+        await connection.send_complete()
+        first = await connection.receive()
+        ttfb = time.perf_counter() - start
+
+    data = first + bytes(connection.response_data)
+    return connection.status_code, ttfb, time.perf_counter() - start, data
+
+
+async def audio_of(client, response_format, data):
+
+    if response_format in ('bytes', 'stream', 'wav'):
+        return data
+
+    result = json.loads(data)['result']['data']
+
+    if response_format == 'base64':
+        return base64.b64decode(result['audio_data'])
+
+    status, ttfb, elapsed, audio = await send(client, 'GET', '/audio-file/' + result['url'].rsplit('/', 1)[-1])
+    return audio
+
+
+def percentile(values, q):
+
+    return float(np.percentile(values, q)) * 1000 if values else None
+
+
+async def run_case(client, scenario, response_format, concurrency, count, files):
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, ttfbs, rtfs = [], [], []
+    errors = 0
+
+    async def one(i):
+        nonlocal errors
+
+        async with semaphore:
+
+            if scenario == 'audio_file':
+                method, path, payload = 'GET', '/audio-file/' + files[i % len(files)], None
+            else:
+                method, path, payload = requests_for(scenario, response_format)
+
+            status, ttfb, elapsed, data = await send(client, method, path, payload)
+
+            if status not in (200, 206):
+                errors += 1
+                return
+
+            latencies.append(elapsed)
+            ttfbs.append(ttfb)
+
+            if scenario != 'audio_file':
+                duration = wav_duration(await audio_of(client, response_format, data))
+
+                if duration:
+                    rtfs.append(elapsed / duration)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    wall = time.perf_counter() - start
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'ttfb_p50_ms': percentile(ttfbs, 50),
+        'ttfb_p95_ms': percentile(ttfbs, 95),
+        'throughput_rps': len(latencies) / wall if wall else None,
+        'rtf': float(np.mean(rtfs)) if rtfs else None,
+    }
+
+
+async def prepare_files(client, count):
+
+    # Files served by the audio_file scenario
+    files = []
+
+    for i in range(count):
+        status, ttfb, elapsed, data = await send(client, 'POST', '/v2/generate-audio', {'model': 'en', 'input': TEXT, 'voice': 'raw', 'response_format': 'url'})
+        files.append(json.loads(data)['result']['data']['url'].rsplit('/', 1)[-1])
+
+    return files
+
+
+async def benchmark(app, scenarios, concurrencies, count):
+
+    results = {}
+
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+        files = await prepare_files(client, 4) if 'audio_file' in scenarios else []
+
+        for scenario in scenarios:
+            response_formats = RESPONSE_FORMATS if scenario in ('v1_generate', 'v2_generate', 'v1_change_voice') else ['wav']
+
+            # One untimed request first, so the one-off SE extraction is not in the first case
+            if scenario != 'audio_file':
+                await send(client, *requests_for(scenario, response_formats[0]))
+
+            for response_format in response_formats:
+                for concurrency in concurrencies:
+                    name = f'{scenario}/{response_format}/c{concurrency}'
+                    results[name] = await run_case(client, scenario, response_format, concurrency, count, files)
+                    print(format_result(name, results[name]), flush=True)
+
+    return results
+
+
+def format_value(value, pattern):
+
+    return pattern.format(value) if value is not None else '-'
+
+
+def format_result(name, result):
+
+    return (
+        f"{name:<36} p50 {format_value(result['p50_ms'], '{:8.1f}')} ms"
+        f"  p95 {format_value(result['p95_ms'], '{:8.1f}')} ms"
+        f"  p99 {format_value(result['p99_ms'], '{:8.1f}')} ms"
+        f"  ttfb {format_value(result['ttfb_p50_ms'], '{:8.1f}')} ms"
+        f"  {format_value(result['throughput_rps'], '{:7.2f}')} req/s"
+        f"  rtf {format_value(result['rtf'], '{:6.3f}')}"
+        f"  errors {result['errors']}"
+    )
+
+
+def compare(results, baseline, tolerance):
+
+    regressions = []
+
+    for name, result in results.items():
+        reference = baseline.get(name)
+
+        if not reference:
+            continue
+
+        if result['errors'] > reference['errors']:
+            regressions.append(f"{name}: {result['errors']} errors (baseline {reference['errors']})")
+
+        if result['p95_ms'] and reference['p95_ms'] and result['p95_ms'] > reference['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']:.1f} ms (baseline {reference['p95_ms']:.1f} ms)")
+
+        if result['throughput_rps'] and reference['throughput_rps'] and result['throughput_rps'] < reference['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{name}: {result['throughput_rps']:.2f} req/s (baseline {reference['throughput_rps']:.2f} req/s)")
+
+    return regressions
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the OpenVoice API with stub models')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma separated list of scenarios')
+    parser.add_argument('--concurrency', default='1,4', help='comma separated list of concurrency levels')
+    parser.add_argument('--requests', type=int, default=20, help='requests per scenario and concurrency level')
+    parser.add_argument('--baseline', default=f'{BENCHMARKS_DIRECTORY}/baseline.json', help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--no-compare', action='store_true', help='do not compare with the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--output', help='also write the results to this file')
+    args = parser.parse_args()
+
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+    concurrencies = [int(concurrency) for concurrency in args.concurrency.split(',') if concurrency.strip()]
+
+    with tempfile.TemporaryDirectory(prefix='openvoice-benchmark-') as work_path:
+        configure(work_path)
+        stubs.install()
+        from app import app
+        results = asyncio.run(benchmark(app, scenarios, concurrencies, args.requests))
+
+    report = {'stub_rtf': stubs.RTF, 'requests': args.requests, 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    if args.no_compare:
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline}, run with --save-baseline to create one or with --no-compare to skip the comparison')
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline['results'], args.tolerance)
+
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    if regressions:
+        sys.exit(1)
+
+    print(f'No regression over {args.tolerance:.0%} against {args.baseline}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Stand-ins for the OpenVoice and melo models, so the API can be benchmarked on any
+cpu-only machine without checkpoints. Every model sleeps for BENCHMARK_STUB_RTF
+seconds per second of audio it produces and returns a sine wave.
+"""
+import os, re, sys, time, json, types
+import numpy as np
+import torch
+
+SAMPLING_RATE = 22050
+HOP_LENGTH = 256
+FILTER_LENGTH = 1024
+GIN_CHANNELS = 256
+SECONDS_PER_CHARACTER = 0.06
+RTF = float(os.getenv("BENCHMARK_STUB_RTF", 0.05))
+
+SPEAKER_IDS = {
+    'EN': {'EN-US': 0, 'EN-BR': 1, 'EN_INDIA': 2, 'EN-AU': 3, 'EN-Default': 4},
+    'ES': {'ES': 0},
+    'FR': {'FR': 0},
+    'ZH': {'ZH': 1},
+    'JP': {'JP': 0},
+    'KR': {'KR': 0},
+}
+
+STYLES_V1 = ['default', 'whispering', 'shouting', 'excited', 'cheerful', 'terrified', 'angry', 'sad', 'friendly']
+
+
+def hparams(spk2id):
+
+    data = types.SimpleNamespace(
+        sampling_rate=SAMPLING_RATE,
+        hop_length=HOP_LENGTH,
+        filter_length=FILTER_LENGTH,
+        win_length=FILTER_LENGTH,
+        spk2id=spk2id,
+    )
+    return types.SimpleNamespace(data=data, model=types.SimpleNamespace(gin_channels=GIN_CHANNELS))
+
+
+def sine(samples):
+
+    t = np.arange(samples, dtype=np.float32) / SAMPLING_RATE
+    return (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def speech(text, speed):
+
+    duration = max(0.5, len(text) * SECONDS_PER_CHARACTER / speed)
+    time.sleep(duration * RTF)
+    return sine(int(duration * SAMPLING_RATE))
+
+
+def split_sentences(text):
+
+    return [piece.strip() for piece in re.split(r'(?<=[.!?。！？])\s*', text) if piece.strip()]
+
+
+class StubNet(torch.nn.Module):
+
+    def __init__(self):
+
+        super().__init__()
+        self.proj = torch.nn.Linear(16, 16)
+
+    def voice_conversion(self, y, y_lengths, sid_src, sid_tgt, tau=1.0):
+
+        samples = y.size(-1) * HOP_LENGTH
+        time.sleep(samples / SAMPLING_RATE * RTF)
+        o = torch.from_numpy(sine(samples)).repeat(y.size(0), 1, 1)
+        return o, None, None
+
+
+class BaseSpeakerTTS:
+
+    language_marks = {"english": "EN", "chinese": "ZH"}
+
+    def __init__(self, config_path, device='cpu'):
+
+        self.device = device
+        self.hps = hparams({style: i for i, style in enumerate(STYLES_V1)})
+        self.model = StubNet()
+
+    def load_ckpt(self, ckpt_path):
+
+        pass
+
+    @staticmethod
+    def split_sentences_into_pieces(text, language_str):
+
+        return split_sentences(text)
+
+    def tts(self, text, output_path, speaker, language='English', speed=1.0):
+
+        return speech(text, speed)
+
+
+class ToneColorConverter:
+
+    def __init__(self, config_path, device='cpu', enable_watermark=True):
+
+        self.device = device
+        self.hps = hparams({})
+        self.model = StubNet()
+        self.watermark_model = None
+
+    def load_ckpt(self, ckpt_path):
+
+        pass
+
+    def add_watermark(self, audio, message):
+
+        return audio
+
+
+class TTS:
+
+    def __init__(self, language, device='auto', use_hf=True, config_path=None, ckpt_path=None):
+
+        self.language = language
+        self.device = device
+        self.hps = hparams(SPEAKER_IDS[language])
+        self.model = StubNet()
+
+    @staticmethod
+    def split_sentences_into_pieces(text, language, quiet=False):
+
+        return split_sentences(text)
+
+    def tts_to_file(self, text, speaker_id, output_path=None, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, speed=1.0, pbar=None, format=None, position=None, quiet=False):
+
+        return speech(text, speed)
+
+
+def get_se(audio_path, vc_model, target_dir='processed', vad=True):
+
+    return torch.zeros(1, GIN_CHANNELS, 1), os.path.basename(audio_path)
+
+
+def spectrogram_torch(y, n_fft, sampling_rate, hop_size, win_size, center=False):
+
+    frames = max(1, (y.size(-1) - n_fft) // hop_size + 1)
+    return torch.zeros(y.size(0), n_fft // 2 + 1, frames)
+
+
+def load_or_download_config(locale, use_hf=True, config_path=None):
+
+    return types.SimpleNamespace(data=types.SimpleNamespace(spk2id=SPEAKER_IDS[locale]))
+
+
+def install():
+
+    # Registers the stubs under the module names imported by the app
+    modules = {
+        'openvoice': {},
+        'openvoice.api': {'BaseSpeakerTTS': BaseSpeakerTTS, 'ToneColorConverter': ToneColorConverter},
+        'openvoice.se_extractor': {'get_se': get_se},
+        'openvoice.mel_processing': {'spectrogram_torch': spectrogram_torch},
+        'melo': {},
+        'melo.api': {'TTS': TTS},
+        'melo.download_utils': {'load_or_download_config': load_or_download_config},
+        'melo.utils': {},
+    }
+
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
+
+        if '.' in name:
+            parent, child = name.rsplit('.', 1)
+            setattr(sys.modules[parent], child, module)
+
+
+def create_checkpoints(openvoice_path, languages_v1, languages_v2):
+
+    # Empty checkpoint tree with the files initialize_globals reads or hashes
+    se = torch.zeros(1, GIN_CHANNELS, 1)
+
+    for version_path in ['checkpoints', 'checkpoints_v2']:
+        os.makedirs(f'{openvoice_path}/{version_path}/converter', exist_ok=True)
+
+        with open(f'{openvoice_path}/{version_path}/converter/config.json', 'w') as f:
+            json.dump({}, f)
+
+        with open(f'{openvoice_path}/{version_path}/converter/checkpoint.pth', 'wb') as f:
+            f.write(version_path.encode('utf-8'))
+
+    for language in languages_v1:
+        path = f'{openvoice_path}/checkpoints/base_speakers/{language}'
+        os.makedirs(path, exist_ok=True)
+        torch.save(se, f'{path}/{language.lower()}_default_se.pth')
+
+    os.makedirs(f'{openvoice_path}/checkpoints_v2/base_speakers/ses', exist_ok=True)
+
+    for language in languages_v2:
+        for speaker_key in SPEAKER_IDS[language]:
+            accent = speaker_key.lower().replace('_', '-')
+            torch.save(se, f'{openvoice_path}/checkpoints_v2/base_speakers/ses/{accent}.pth')
@@ -1,8 +1,11 @@
 # init.py
 import os
-from openvoice.api import ToneColorConverter, BaseSpeakerTTS
-from melo.api import TTS
-from openvoice import se_extractor
+from openvoice.api import ToneColorConverter
+from melo.download_utils import load_or_download_config
+from models.Embedding import Embedding
+from models.Registry import Registry
+from models.Precision import Precision
+from models.Compiler import Compiler
 
 def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_FILES_PATH, WATERMARK, USE_VAD):
     MODEL_LANGUAGES_CODES_V1 = []
@@ -10,10 +13,8 @@ def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_
     reference_speakers = {}
     targets_v2 = {}
     targets_v1 = {}
-    models = {}
     speaker_ids = {}
     ckpt_base = {}
-    base_speaker_tts = {}
     tone_color_converter_v1 = ''
     tone_color_converter_v2 = ''
     STYLES_V1 = ['default', 'whispering', 'shouting', 'excited', 'cheerful', 'terrified', 'angry', 'sad', 'friendly']
@@ -23,6 +24,18 @@ def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_
     SPEAKERS_FOLDER = os.getenv("SPEAKERS_FOLDER", "speakers")
     SPEAKERS = os.getenv("SPEAKERS", "elon,rachel,kaiwen").split(",")
     BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+    SE_CACHE_PATH = os.getenv("SE_CACHE_PATH", f"{BASE_DIRECTORY}/cache/se")
+    MODEL_PRELOAD = [item.strip().lower() for item in os.getenv("MODEL_PRELOAD", "*").split(",") if item.strip()]
+    MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", 0))
+    PRECISION_V1 = os.getenv("PRECISION_V1", "fp32").lower()
+    PRECISION_V2 = os.getenv("PRECISION_V2", "fp32").lower()
+    PRECISION_TOLERANCE = float(os.getenv("PRECISION_TOLERANCE", 0.1))
+    CONVERTER_BACKEND_V1 = os.getenv("CONVERTER_BACKEND_V1", "eager").lower()
+    CONVERTER_BACKEND_V2 = os.getenv("CONVERTER_BACKEND_V2", "eager").lower()
+    CONVERTER_CACHE_PATH = os.getenv("CONVERTER_CACHE_PATH", f"{BASE_DIRECTORY}/cache/converter")
+    CONVERTER_BUCKETS = [int(frames) for frames in os.getenv("CONVERTER_BUCKETS", "256,512,1024,2048,4096").split(",") if frames.strip()]
+    checkpoint_hash_v1 = ''
+    checkpoint_hash_v2 = ''
 
     if MODEL_LANGUAGES_V1 and any(MODEL_LANGUAGES_V1): 
         for item in MODEL_LANGUAGES_V1:
@@ -46,12 +59,10 @@ def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_
         ckpt_converter = f'{OPENVOICE_PATH}/checkpoints/converter'
         tone_color_converter_v1 = ToneColorConverter(f'{ckpt_converter}/config.json', device=DEVICE_V1)
         tone_color_converter_v1.load_ckpt(f'{ckpt_converter}/checkpoint.pth')
-        logger.info(" > Loading v1 models: " + ", ".join(MODEL_LANGUAGES_CODES_V1))
+        checkpoint_hash_v1 = Embedding.hash_file(f'{ckpt_converter}/checkpoint.pth')
         for lang in MODEL_LANGUAGES_CODES_V1:
             lang = lang.upper()
             ckpt_base[lang] = f'{OPENVOICE_PATH}/checkpoints/base_speakers/{lang}'
-            base_speaker_tts[lang] = BaseSpeakerTTS(f"{ckpt_base[lang]}/config.json", device=DEVICE_V1)
-            base_speaker_tts[lang].load_ckpt(f"{ckpt_base[lang]}/checkpoint.pth")
 
     # Load version 2
     MODEL_LANGUAGES_V2 = [lang for lang in MODEL_LANGUAGES_V2 if lang.strip()]
@@ -61,11 +72,25 @@ def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_
         ckpt_converter_v2 = f'{OPENVOICE_PATH}/checkpoints_v2/converter'
         tone_color_converter_v2 = ToneColorConverter(f'{ckpt_converter_v2}/config.json', device=DEVICE_V2)
         tone_color_converter_v2.load_ckpt(f'{ckpt_converter_v2}/checkpoint.pth')
-        logger.info(" > Loading v2 models: " + ", ".join(MODEL_LANGUAGES_V2))
+        checkpoint_hash_v2 = Embedding.hash_file(f'{ckpt_converter_v2}/checkpoint.pth')
         for lang in MODEL_LANGUAGES_V2:
             lang = lang.upper()
-            models[lang] = TTS(language=lang, device=DEVICE_V2)
-            speaker_ids[lang] = models[lang].hps.data.spk2id
+            # Only the config is needed for the accents, the weights are loaded by the registry
+            speaker_ids[lang] = load_or_download_config(lang).data.spk2id
+
+    Precision.set_vars(logger, {'v1': PRECISION_V1, 'v2': PRECISION_V2}, PRECISION_TOLERANCE)
+
+    # Load the TTS models listed in MODEL_PRELOAD, the others are loaded on first use
+    Registry.set_vars(logger, ckpt_base, {'v1': DEVICE_V1, 'v2': DEVICE_V2}, int(MODEL_MEMORY_BUDGET_MB * 1024 * 1024))
+    configured_models = [('v1', lang) for lang in ckpt_base] + [('v2', lang) for lang in speaker_ids]
+    preload_models = [(version, lang) for version, lang in configured_models if '*' in MODEL_PRELOAD or f'{version}:{lang}'.lower() in MODEL_PRELOAD]
+
+    if preload_models:
+        logger.info(" > Preloading models: " + ", ".join(f'{version}:{lang}' for version, lang in preload_models))
+        Registry.preload(preload_models)
+
+    # Load base speakers source SE
+    source_ses = Embedding.build_source_ses(logger, OPENVOICE_PATH, ckpt_base, speaker_ids, DEVICE_V1, DEVICE_V2)
 
     # Load speakers
     for speaker in SPEAKERS:
@@ -73,10 +98,28 @@ def initialize_globals(app, logger, OPENVOICE_PATH, DEVICE_V1, DEVICE_V2, AUDIO_
         
         if MODEL_LANGUAGES_CODES_V1:
             logger.info(f" > Loading SE extractors v1 for speaker {speaker}")
-            targets_v1[speaker], audio_name = se_extractor.get_se(reference_speakers[speaker], tone_color_converter_v1, vad=USE_VAD)
+            targets_v1[speaker] = Embedding.get_target_se(logger, reference_speakers[speaker], tone_color_converter_v1, checkpoint_hash_v1, USE_VAD, f'{SE_CACHE_PATH}/v1')
         
         if MODEL_LANGUAGES_V2:
             logger.info(f" > Loading SE extractors v2 for speaker {speaker}")
-            targets_v2[speaker], audio_name = se_extractor.get_se(reference_speakers[speaker], tone_color_converter_v2, vad=USE_VAD)
+            targets_v2[speaker] = Embedding.get_target_se(logger, reference_speakers[speaker], tone_color_converter_v2, checkpoint_hash_v2, USE_VAD, f'{SE_CACHE_PATH}/v2')
+
+    # Switch the converters precision once the speaker embeddings are extracted in fp32,
+    # so the cached embeddings do not depend on the precision. The reference encoder, which
+    # only extracts embeddings, is kept in fp32 for the voices registered at runtime
+    if MODEL_LANGUAGES_CODES_V1:
+        Precision.apply('converter_v1', 'v1', tone_color_converter_v1, lambda: Precision.sample_conversion(tone_color_converter_v1), keep=('ref_enc',))
+
+    if MODEL_LANGUAGES_V2:
+        Precision.apply('converter_v2', 'v2', tone_color_converter_v2, lambda: Precision.sample_conversion(tone_color_converter_v2), keep=('ref_enc',))
+
+    # Compiled graphs are built per length bucket on first use and cached on disk
+    Compiler.set_vars(logger, CONVERTER_CACHE_PATH, CONVERTER_BUCKETS)
+
+    if MODEL_LANGUAGES_CODES_V1:
+        Compiler.prepare('converter_v1', tone_color_converter_v1, CONVERTER_BACKEND_V1, checkpoint_hash_v1, Precision.stats()['converter_v1'])
+
+    if MODEL_LANGUAGES_V2:
+        Compiler.prepare('converter_v2', tone_color_converter_v2, CONVERTER_BACKEND_V2, checkpoint_hash_v2, Precision.stats()['converter_v2'])
 
-    return (MODEL_LANGUAGES_CODES_V1, MODEL_LANGUAGES_NAMES_V1, reference_speakers, targets_v2, targets_v1, models, speaker_ids, ckpt_base, base_speaker_tts, tone_color_converter_v1, tone_color_converter_v2, STYLES_V1)
+    return (MODEL_LANGUAGES_CODES_V1, MODEL_LANGUAGES_NAMES_V1, reference_speakers, targets_v2, targets_v1, speaker_ids, ckpt_base, tone_color_converter_v1, tone_color_converter_v2, STYLES_V1, source_ses, SE_CACHE_PATH, {'v1': checkpoint_hash_v1, 'v2': checkpoint_hash_v2})
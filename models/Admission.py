@@ -0,0 +1,176 @@
+import asyncio, math, time
+from collections import deque
+from quart.wrappers.response import ResponseBody
+from models.Response import Response
+
+class Admission:
+
+    @staticmethod
+    def set_vars(logger, limits, queue_limits, queue_timeout, window=60):
+
+        Admission.logger = logger
+        Admission.limits = limits
+        Admission.queue_limits = queue_limits
+        Admission.queue_timeout = queue_timeout
+        Admission.window = window
+        Admission.states = {}
+
+    @staticmethod
+    def get_state(key):
+
+        if key not in Admission.states:
+            # Keys are "version:language", limits fall back to the version then to the default
+            version = key.split(':')[0]
+            limit = Admission.limits.get(key, Admission.limits.get(version, Admission.limits['default']))
+            queue_limit = Admission.queue_limits.get(key, Admission.queue_limits.get(version, Admission.queue_limits['default']))
+            Admission.states[key] = {
+                'semaphore': asyncio.Semaphore(limit) if limit > 0 else None,
+                'limit': limit,
+                'queue_limit': queue_limit,
+                'active': 0,
+                'queued': 0,
+                'rejected': 0,
+                'timeouts': 0,
+                'completed': deque(),
+            }
+
+        return Admission.states[key]
+
+    @staticmethod
+    def stats():
+
+        return {
+            key: {name: state[name] for name in ('limit', 'queue_limit', 'active', 'queued', 'rejected', 'timeouts')}
+            for key, state in Admission.states.items()
+        }
+
+    @staticmethod
+    def retry_after(state):
+
+        # Time for the requests ahead to drain at the throughput of the last window
+        now = time.monotonic()
+        Admission.prune(state, now)
+
+        if not state['completed']:
+            return 1
+
+        throughput = len(state['completed']) / min(Admission.window, max(now - state['completed'][0], 1))
+        return max(1, min(Admission.window, math.ceil((state['queued'] + 1) / throughput)))
+
+    @staticmethod
+    def prune(state, now):
+
+        while state['completed'] and state['completed'][0] < now - Admission.window:
+            state['completed'].popleft()
+
+    @staticmethod
+    def rejection(code, message, retry_after):
+
+        return Response.payload(False, code, message, {'retry_after': retry_after})
+
+    @staticmethod
+    async def acquire(key, timeout=None):
+
+        # Returns None once a slot is held, or an error payload when the request is shed,
+        # timeout is the time left before the request deadline
+        state = Admission.get_state(key)
+        wait = Admission.queue_timeout if Admission.queue_timeout > 0 else None
+        # When the request deadline comes first, running out of time is a deadline error (504)
+        deadline_first = timeout is not None and (wait is None or timeout <= wait)
+
+        if timeout is not None:
+            wait = timeout if wait is None else min(wait, timeout)
+
+        if state['semaphore'] is None:
+            state['active'] += 1
+            return None
+
+        if state['semaphore'].locked() and state['queued'] >= state['queue_limit']:
+            state['rejected'] += 1
+            return Admission.rejection(429, f"Too many requests for {key}, try again later", Admission.retry_after(state))
+
+        state['queued'] += 1
+
+        try:
+            if wait is not None:
+                await asyncio.wait_for(state['semaphore'].acquire(), wait)
+            else:
+                await state['semaphore'].acquire()
+        except asyncio.TimeoutError:
+            if deadline_first:
+                raise
+
+            state['timeouts'] += 1
+            return Admission.rejection(503, f"Server overloaded, {key} queue wait exceeded", Admission.retry_after(state))
+        finally:
+            state['queued'] -= 1
+
+        state['active'] += 1
+        return None
+
+    @staticmethod
+    def hold(key, body):
+
+        return Hold(key, body)
+
+    @staticmethod
+    def release(key):
+
+        state = Admission.states[key]
+        state['active'] -= 1
+        now = time.monotonic()
+        state['completed'].append(now)
+        Admission.prune(state, now)
+
+        if state['semaphore'] is not None:
+            state['semaphore'].release()
+
+
+class Hold(ResponseBody):
+
+    # Body of a streamed response that keeps its admission slot until the body ends or is closed.
+    # Unlike an async generator, closing it before the first chunk still releases the slot, and
+    # a body dropped without being sent releases it when collected. Quart only takes async
+    # iterables other than async generators as a ResponseBody
+    def __init__(self, key, body):
+
+        self.key = key
+        self.body = body
+        self.released = False
+
+    async def __aenter__(self):
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+
+        await self.aclose()
+
+    def __aiter__(self):
+
+        return self
+
+    async def __anext__(self):
+
+        try:
+            return await self.body.__anext__()
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self):
+
+        try:
+            await self.body.aclose()
+        finally:
+            self.release()
+
+    def release(self):
+
+        if not self.released:
+            self.released = True
+            Admission.release(self.key)
+
+    def __del__(self):
+
+        self.release()
@@ -0,0 +1,66 @@
+import io, struct, librosa, soundfile
+import numpy as np
+
+class Audio:
+
+    @staticmethod
+    def load(data, sampling_rate):
+
+        if isinstance(data, (bytes, bytearray)):
+            data = io.BytesIO(data)
+
+        audio, sampling_rate = librosa.load(data, sr=sampling_rate)
+        return audio
+
+    @staticmethod
+    def crossfade(tail, audio):
+
+        # Linear crossfade of the end of the previous window into the start of the next one
+        length = min(len(tail), len(audio))
+
+        if length == 0:
+            return audio
+
+        fade = np.linspace(0.0, 1.0, length, dtype=np.float32)
+        return np.concatenate([tail[:length] * (1.0 - fade) + audio[:length] * fade, audio[length:]])
+
+    @staticmethod
+    def resample(audio, orig_sr, target_sr):
+
+        if orig_sr == target_sr:
+            return audio
+
+        return librosa.resample(audio, orig_sr=orig_sr, target_sr=target_sr)
+
+    @staticmethod
+    def to_wav(audio, sampling_rate):
+
+        buffer = io.BytesIO()
+        soundfile.write(buffer, audio, sampling_rate, format='WAV', subtype='PCM_16')
+        return buffer.getvalue()
+
+    @staticmethod
+    def save(audio, sampling_rate, path):
+
+        soundfile.write(path, audio, sampling_rate, format='WAV', subtype='PCM_16')
+        return path
+
+    @staticmethod
+    def to_pcm16(audio):
+
+        return (np.clip(audio, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+    @staticmethod
+    def wav_header(sampling_rate, channels=1, bits_per_sample=16, data_size=0xFFFFFFFF):
+
+        # The total length is unknown while streaming, so the RIFF and data sizes
+        # are set to the maximum value which players treat as "read until EOF"
+        byte_rate = sampling_rate * channels * bits_per_sample // 8
+        block_align = channels * bits_per_sample // 8
+        riff_size = 0xFFFFFFFF if data_size == 0xFFFFFFFF else data_size + 36
+        return struct.pack(
+            '<4sI4s4sIHHIIHH4sI',
+            b'RIFF', riff_size, b'WAVE',
+            b'fmt ', 16, 1, channels, sampling_rate, byte_rate, block_align, bits_per_sample,
+            b'data', data_size
+        )
@@ -0,0 +1,72 @@
+import asyncio
+from models.Inference import Inference
+
+class Batcher:
+
+    @staticmethod
+    def set_vars(logger, max_batch_size, max_wait):
+
+        Batcher.logger = logger
+        Batcher.max_batch_size = max_batch_size
+        Batcher.max_wait = max_wait
+        Batcher.pending = {}
+
+    @staticmethod
+    def enabled():
+
+        return Batcher.max_batch_size > 1
+
+    @staticmethod
+    async def submit(key, device, model_key, batch_func, item):
+
+        # Requests sharing the same key within max_wait seconds are run as one batch,
+        # batch_func receives the list of items and returns one result per item
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = Batcher.pending.get(key)
+
+        if batch is None:
+            batch = []
+            Batcher.pending[key] = batch
+            loop.call_later(Batcher.max_wait, Batcher.flush, key, batch, device, model_key, batch_func)
+
+        batch.append((item, future))
+
+        if len(batch) >= Batcher.max_batch_size:
+            Batcher.flush(key, batch, device, model_key, batch_func)
+
+        return await future
+
+    @staticmethod
+    def flush(key, batch, device, model_key, batch_func):
+
+        # The timer of an already flushed batch must not flush the next one
+        if Batcher.pending.get(key) is not batch:
+            return
+
+        del Batcher.pending[key]
+        asyncio.ensure_future(Batcher.run(batch, device, model_key, batch_func))
+
+    @staticmethod
+    async def run(batch, device, model_key, batch_func):
+
+        # Requests cancelled while waiting for the batch to fill are left out
+        batch = [(item, future) for item, future in batch if not future.done()]
+
+        if not batch:
+            return
+
+        items = [item for item, future in batch]
+        Batcher.logger.debug(f' > Running batch of {len(items)} request(s) on {model_key}')
+
+        try:
+            results = await Inference.run(device, model_key, batch_func, items)
+        except Exception as e:
+            for item, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (item, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
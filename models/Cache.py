@@ -0,0 +1,210 @@
+import os, json, hashlib, asyncio, soundfile
+from collections import OrderedDict
+from models.Audio import Audio
+from models.Speakers import Speakers
+from models.Embedding import Embedding
+from models.Precision import Precision
+
+class Cache:
+
+    @staticmethod
+    def set_vars(logger, memory_max_bytes, disk_path, disk_max_bytes):
+
+        Cache.logger = logger
+        Cache.memory_max_bytes = memory_max_bytes
+        Cache.disk_path = disk_path
+        Cache.disk_max_bytes = disk_max_bytes
+        Cache.memory = OrderedDict()
+        Cache.memory_bytes = 0
+        Cache.disk = OrderedDict()
+        Cache.disk_bytes = 0
+        Cache.inflight = {}
+        Cache.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0, 'evictions': 0}
+
+        if disk_max_bytes > 0:
+            os.makedirs(disk_path, exist_ok=True)
+            entries = [entry for entry in os.scandir(disk_path) if entry.name.endswith('.wav')]
+
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                Cache.disk[entry.name[:-4]] = entry.stat().st_size
+                Cache.disk_bytes += entry.stat().st_size
+
+            logger.info(f" > Result cache found {len(Cache.disk)} file(s) on disk ({Cache.disk_bytes} bytes)")
+
+    @staticmethod
+    def key(version, args, source_audio=None):
+
+        # The results outlive restarts on disk, so the key holds what the models and SEs depend
+        # on too: the target SE identity, the converter checkpoint and the precisions
+        voice = str(args.get('voice', 'raw')).lower()
+        language = str(args.get('model')).upper()
+        models = {
+            'voice_se': Speakers.identity(version, voice) if voice != 'raw' else None,
+            'checkpoint': Embedding.checkpoint_hashes.get(version, ''),
+            'converter_precision': Precision.mode(f'converter_{version}', version),
+        }
+
+        if source_audio:
+            # The conversion only depends on the clip, which gives the source SE too, and the target voice
+            params = dict(models, version=version, voice=voice, audio=source_audio.digest)
+            return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+        params = {
+            **models,
+            'tts_precision': Precision.mode(f'tts_{version}:{language}', version),
+            'version': version,
+            'model': language,
+            'input': ' '.join(str(args.get('input')).split()),
+            'voice': voice,
+            'style': str(args.get('style', 'default')).lower() if version == 'v1' else None,
+            'accent': str(args.get('accent')).lower().replace('_', '-') if args.get('accent') else None,
+            'speed': float(args.get('speed', 1.0)),
+        }
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def enabled():
+
+        return Cache.memory_max_bytes > 0 or Cache.disk_max_bytes > 0
+
+    @staticmethod
+    def stats():
+
+        return dict(Cache.counters, memory_items=len(Cache.memory), memory_bytes=Cache.memory_bytes, disk_items=len(Cache.disk), disk_bytes=Cache.disk_bytes)
+
+    @staticmethod
+    def contains(key, inflight=True):
+
+        # Whether a request for key is served without inference: the result is stored or, for
+        # requests that wait on it, being produced by an identical request. Counts nothing
+        return key in Cache.memory or key in Cache.disk or (inflight and key in Cache.inflight)
+
+    @staticmethod
+    async def get(key):
+
+        if key in Cache.memory:
+            Cache.memory.move_to_end(key)
+            Cache.counters['memory_hits'] += 1
+            return Cache.memory[key]
+
+        if key in Cache.disk:
+            loop = asyncio.get_running_loop()
+
+            try:
+                result = await loop.run_in_executor(None, Cache.read_file, key)
+            except OSError:
+                # Removed by another worker sharing the same directory
+                Cache.disk_bytes -= Cache.disk.pop(key, 0)
+            else:
+                Cache.disk.move_to_end(key)
+                Cache.counters['disk_hits'] += 1
+                Cache.store_memory(key, result)
+                return result
+
+        Cache.counters['misses'] += 1
+        return None
+
+    @staticmethod
+    async def set(key, result):
+
+        Cache.store_memory(key, result)
+
+        if Cache.disk_max_bytes > 0 and key not in Cache.disk:
+            loop = asyncio.get_running_loop()
+            size = await loop.run_in_executor(None, Cache.write_file, key, result)
+            Cache.disk[key] = size
+            Cache.disk_bytes += size
+
+            while Cache.disk_bytes > Cache.disk_max_bytes and Cache.disk:
+                evicted, evicted_size = Cache.disk.popitem(last=False)
+                Cache.disk_bytes -= evicted_size
+                Cache.counters['evictions'] += 1
+                await loop.run_in_executor(None, Cache.remove_file, evicted)
+
+    @staticmethod
+    async def get_or_create(key, factory):
+
+        # Identical concurrent requests wait on the first one instead of running inference again
+        result = await Cache.get(key)
+
+        if result is not None:
+            return result
+
+        if key in Cache.inflight:
+            Cache.counters['coalesced'] += 1
+            inflight = Cache.inflight[key]
+
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # The first request was cancelled (deadline or disconnect), take over unless this one was too
+                if not inflight.cancelled():
+                    raise
+
+                return await Cache.get_or_create(key, factory)
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        Cache.inflight[key] = future
+
+        try:
+            result = await factory()
+            await Cache.set(key, result)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            del Cache.inflight[key]
+
+    @staticmethod
+    def store_memory(key, result):
+
+        if Cache.memory_max_bytes <= 0:
+            return
+
+        audio, sampling_rate = result
+
+        if key not in Cache.memory:
+            Cache.memory[key] = result
+            Cache.memory_bytes += audio.nbytes
+
+        while Cache.memory_bytes > Cache.memory_max_bytes and Cache.memory:
+            evicted, (evicted_audio, evicted_sampling_rate) = Cache.memory.popitem(last=False)
+            Cache.memory_bytes -= evicted_audio.nbytes
+            Cache.counters['evictions'] += 1
+
+    @staticmethod
+    def file_path(key):
+
+        return f'{Cache.disk_path}/{key}.wav'
+
+    @staticmethod
+    def read_file(key):
+
+        path = Cache.file_path(key)
+        audio, sampling_rate = soundfile.read(path, dtype='float32')
+        os.utime(path)
+        return audio, sampling_rate
+
+    @staticmethod
+    def write_file(key, result):
+
+        audio, sampling_rate = result
+        path = Cache.file_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        Audio.save(audio, sampling_rate, tmp_path)
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    @staticmethod
+    def remove_file(key):
+
+        try:
+            os.remove(Cache.file_path(key))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,111 @@
+import os, threading, torch
+
+class ConversionGraph(torch.nn.Module):
+
+    def __init__(self, model, tau):
+
+        super().__init__()
+        self.model = model
+        self.tau = tau
+
+    def forward(self, spec, spec_lengths, sid_src, sid_tgt):
+
+        return self.model.voice_conversion(spec, spec_lengths, sid_src=sid_src, sid_tgt=sid_tgt, tau=self.tau)[0]
+
+class Compiler:
+
+    backends = ['eager', 'compile', 'torchscript']
+
+    @staticmethod
+    def set_vars(logger, cache_path, buckets):
+
+        Compiler.logger = logger
+        Compiler.cache_path = cache_path
+        Compiler.buckets = sorted(buckets)
+        Compiler.states = {}
+
+    @staticmethod
+    def stats():
+
+        return {state['name']: state['backend'] for state in Compiler.states.values()}
+
+    @staticmethod
+    def prepare(name, converter, backend, checkpoint_hash, precision):
+
+        if backend not in Compiler.backends:
+            raise ValueError(f"Invalid converter backend {backend} for {name}, supported values are {', '.join(Compiler.backends)}")
+
+        if backend == 'compile':
+            # Lets inductor reuse the kernels it compiled during a previous run
+            os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', f'{Compiler.cache_path}/inductor')
+            os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+
+        Compiler.states[id(converter)] = {
+            'name': name,
+            'backend': backend,
+            'prefix': f'{name}_{checkpoint_hash[:16]}_{precision}',
+            'graphs': {},
+            'lock': threading.Lock(),
+        }
+        Compiler.logger.info(f" > Using the {backend} backend for {name}")
+
+    @staticmethod
+    def bucket(frames):
+
+        return next((bucket for bucket in Compiler.buckets if bucket >= frames), None)
+
+    @staticmethod
+    def build(state, converter, key, tau, inputs):
+
+        graph = ConversionGraph(converter.model, tau).eval()
+
+        if state['backend'] == 'compile':
+            return torch.compile(graph, dynamic=False)
+
+        batch_size, frames = key[0], key[1]
+        path = f"{Compiler.cache_path}/{state['prefix']}_{batch_size}x{frames}_{tau}.pt"
+
+        if os.path.exists(path):
+            Compiler.logger.debug(f" > Loading traced {state['name']} graph for {batch_size}x{frames} frames")
+            return torch.jit.load(path, map_location=converter.device)
+
+        Compiler.logger.info(f" > Tracing {state['name']} graph for {batch_size}x{frames} frames")
+        # The encoder samples noise, so the traced outputs can not be checked against eager ones
+        traced = torch.jit.trace(graph, inputs, check_trace=False)
+        os.makedirs(Compiler.cache_path, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        torch.jit.save(traced, tmp_path)
+        os.replace(tmp_path, path)
+        return traced
+
+    @staticmethod
+    def voice_conversion(converter, spec, spec_lengths, sid_src, sid_tgt, tau=0.3):
+
+        # Drop-in replacement for converter.model.voice_conversion(...)[0], spectrograms are
+        # zero padded to the next length bucket so every bucket is compiled only once
+        state = Compiler.states.get(id(converter))
+        frames = spec.size(-1)
+        bucket = Compiler.bucket(frames)
+
+        if state is None or state['backend'] == 'eager' or bucket is None:
+            return converter.model.voice_conversion(spec, spec_lengths, sid_src=sid_src, sid_tgt=sid_tgt, tau=tau)[0]
+
+        if bucket > frames:
+            spec = torch.nn.functional.pad(spec, (0, bucket - frames))
+
+        key = (spec.size(0), bucket, tau)
+        inputs = (spec, spec_lengths, sid_src, sid_tgt)
+
+        try:
+            with state['lock']:
+                if key not in state['graphs']:
+                    state['graphs'][key] = Compiler.build(state, converter, key, tau, inputs)
+
+            o = state['graphs'][key](*inputs)
+        except Exception as e:
+            Compiler.logger.warning(f" > The {state['backend']} backend failed for {state['name']}, falling back to eager: {e}")
+            state['backend'] = 'eager'
+            state['graphs'] = {}
+            return converter.model.voice_conversion(spec[..., :frames], spec_lengths, sid_src=sid_src, sid_tgt=sid_tgt, tau=tau)[0]
+
+        return o[..., :frames * converter.hps.data.hop_length]
@@ -0,0 +1,53 @@
+import asyncio, time, contextvars
+
+class Deadline:
+
+    current = contextvars.ContextVar('request_deadline', default=None)
+
+    @staticmethod
+    def set_vars(logger, default_timeout, max_timeout):
+
+        Deadline.logger = logger
+        Deadline.default_timeout = default_timeout
+        Deadline.max_timeout = max_timeout
+
+    @staticmethod
+    def start(headers):
+
+        # The client may ask for a shorter (or, up to max_timeout, longer) deadline than the default
+        timeout = Deadline.default_timeout
+
+        try:
+            timeout = float(headers.get('X-Request-Timeout', timeout))
+        except ValueError:
+            pass
+
+        if Deadline.max_timeout > 0:
+            timeout = min(timeout, Deadline.max_timeout) if timeout > 0 else Deadline.max_timeout
+
+        Deadline.current.set(time.monotonic() + timeout if timeout > 0 else None)
+
+    @staticmethod
+    def remaining():
+
+        deadline = Deadline.current.get()
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    @staticmethod
+    def check():
+
+        # Called between pipeline stages, so no new work starts past the deadline
+        remaining = Deadline.remaining()
+
+        if remaining is not None and remaining <= 0:
+            raise asyncio.TimeoutError('Request deadline exceeded')
+
+    @staticmethod
+    async def wait(awaitable):
+
+        remaining = Deadline.remaining()
+
+        if remaining is None:
+            return await awaitable
+
+        return await asyncio.wait_for(awaitable, remaining)
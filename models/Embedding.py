@@ -0,0 +1,180 @@
+import os, torch, shutil, hashlib, tempfile
+from collections import OrderedDict
+from openvoice import se_extractor
+from models.Precision import Precision
+
+class Embedding:
+
+    # SE cache key of every target SE loaded or extracted, by (reference file, checkpoint hash),
+    # filled from init before set_vars
+    target_keys = {}
+
+    @staticmethod
+    def set_vars(logger, source_ses, openvoice_path, ckpt_base, devices, cache_path='', checkpoint_hashes=None, vad=False, upload_cache_size=0):
+
+        Embedding.logger = logger
+        Embedding.source_ses = source_ses
+        Embedding.openvoice_path = openvoice_path
+        Embedding.ckpt_base = ckpt_base
+        Embedding.devices = devices
+        Embedding.cache_path = cache_path
+        Embedding.checkpoint_hashes = checkpoint_hashes or {}
+        Embedding.vad = vad
+        Embedding.upload_cache_size = upload_cache_size
+        Embedding.upload_ses = OrderedDict()
+        Embedding.inflight = {}
+        Embedding.counters = {'upload_hits': 0, 'upload_misses': 0}
+
+    @staticmethod
+    def source_se_path(openvoice_path, ckpt_base, version, language, accent):
+
+        if version == 'v1':
+            return f'{ckpt_base[language]}/{language.lower()}_{accent}_se.pth'
+
+        return f'{openvoice_path}/checkpoints_v2/base_speakers/ses/{accent}.pth'
+
+    @staticmethod
+    def load_source_se(path, device):
+
+        return torch.load(path, map_location=device)
+
+    @staticmethod
+    def build_source_ses(logger, openvoice_path, ckpt_base, speaker_ids, device_v1, device_v2):
+
+        source_ses = {}
+
+        for language in ckpt_base:
+            path = Embedding.source_se_path(openvoice_path, ckpt_base, 'v1', language, 'default')
+            logger.info(f" > Loading v1 source SE for {language}")
+            source_ses[('v1', language, 'default')] = Embedding.load_source_se(path, device_v1)
+
+        for language, ids in speaker_ids.items():
+
+            for speaker_key in ids.keys():
+                accent = speaker_key.lower().replace('_', '-')
+                path = Embedding.source_se_path(openvoice_path, ckpt_base, 'v2', language, accent)
+
+                if not os.path.exists(path):
+                    logger.warning(f" > Missing v2 source SE for {language}/{accent}: {path}")
+                    continue
+
+                logger.info(f" > Loading v2 source SE for {language}/{accent}")
+                source_ses[('v2', language, accent)] = Embedding.load_source_se(path, device_v2)
+
+        return source_ses
+
+    @staticmethod
+    def get_source_se(version, language, accent='default'):
+
+        key = (version, language, accent)
+
+        if key not in Embedding.source_ses:
+            # Not preloaded at startup, load it once and keep it resident
+            path = Embedding.source_se_path(Embedding.openvoice_path, Embedding.ckpt_base, version, language, accent)
+            Embedding.logger.debug(f' > Loading {version} source SE from {path}...')
+            Embedding.source_ses[key] = Embedding.load_source_se(path, Embedding.devices[version])
+
+        return Embedding.source_ses[key]
+
+    @staticmethod
+    def hash_file(path, chunk_size=1024 * 1024):
+
+        sha = hashlib.sha256()
+
+        with open(path, 'rb') as f:
+            chunk = f.read(chunk_size)
+            while chunk:
+                sha.update(chunk)
+                chunk = f.read(chunk_size)
+
+        return sha.hexdigest()
+
+    @staticmethod
+    def target_se_key(reference_file, checkpoint_hash, vad):
+
+        content = f'{Embedding.hash_file(reference_file)}:{checkpoint_hash}:{str(vad).lower()}'
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def get_target_se(logger, reference_file, converter, checkpoint_hash, vad, cache_path):
+
+        key = Embedding.target_se_key(reference_file, checkpoint_hash, vad)
+        Embedding.target_keys[(reference_file, checkpoint_hash)] = key
+        cache_file = f'{cache_path}/{key}.pth'
+
+        if os.path.exists(cache_file):
+            logger.debug(f" > Loading cached SE {key} for {reference_file}")
+            return torch.load(cache_file, map_location=converter.device)
+
+        # The cache key has no precision, so the SE is extracted in fp32 even in the inference
+        # pool of a bf16 converter (its reference encoder is never quantized)
+        with torch.autocast(torch.device(converter.device).type, enabled=False):
+            target_se, audio_name = se_extractor.get_se(reference_file, converter, target_dir=f'{cache_path}/processed', vad=vad)
+
+        os.makedirs(cache_path, exist_ok=True)
+        # Write to a temporary name first so concurrent replicas never read a partial file
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        torch.save(target_se.detach().cpu(), tmp_file)
+        os.replace(tmp_file, cache_file)
+        logger.debug(f" > Cached SE {key} for {reference_file}")
+        return target_se
+
+    @staticmethod
+    def upload_se_key(digest, version):
+
+        # Same inputs as target_se_key, with the upload hash computed while it was received, and the
+        # converter precision since upload SEs are extracted after it was switched
+        precision = Precision.stats().get(f'converter_{version}', 'fp32')
+        content = f'{digest}:{Embedding.checkpoint_hashes.get(version, "")}:{str(Embedding.vad).lower()}:{precision}'
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def lookup_upload_se(key):
+
+        if key in Embedding.upload_ses:
+            Embedding.upload_ses.move_to_end(key)
+            Embedding.counters['upload_hits'] += 1
+            return Embedding.upload_ses[key]
+
+        Embedding.counters['upload_misses'] += 1
+        return None
+
+    @staticmethod
+    def store_upload_se(key, se):
+
+        if Embedding.upload_cache_size <= 0:
+            return
+
+        Embedding.upload_ses[key] = se
+        Embedding.upload_ses.move_to_end(key)
+
+        while len(Embedding.upload_ses) > Embedding.upload_cache_size:
+            Embedding.upload_ses.popitem(last=False)
+
+    @staticmethod
+    def extract_upload_se(key, upload, converter, version):
+
+        # Runs in the inference pool, persisted SEs are shared by the workers and survive restarts
+        cache_path = f'{Embedding.cache_path}/{version}/uploads'
+        cache_file = f'{cache_path}/{key}.pth'
+
+        if os.path.exists(cache_file):
+            Embedding.logger.debug(f" > Loading cached upload SE {key}")
+            return torch.load(cache_file, map_location=converter.device)
+
+        # se_extractor works on a file path and leaves the split segments in target_dir,
+        # both go in a temporary directory removed once the SE is extracted
+        with tempfile.TemporaryDirectory() as tmp_path:
+            audio_file = f'{tmp_path}/{key[:16]}.{upload.extension or "wav"}'
+
+            with open(audio_file, 'wb') as f:
+                shutil.copyfileobj(upload.open(), f)
+
+            target_se, audio_name = se_extractor.get_se(audio_file, converter, target_dir=f'{tmp_path}/processed', vad=Embedding.vad)
+
+        os.makedirs(cache_path, exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        torch.save(target_se.detach().cpu(), tmp_file)
+        os.replace(tmp_file, cache_file)
+        Embedding.logger.debug(f" > Cached upload SE {key}")
+        return target_se
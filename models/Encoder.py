@@ -0,0 +1,138 @@
+import io, asyncio, subprocess, soundfile
+from models.Audio import Audio
+
+class Encoder:
+
+    formats = {
+        'wav': {'mimetype': 'audio/wav', 'ffmpeg': None},
+        'pcm': {'mimetype': 'audio/pcm', 'ffmpeg': None},
+        'flac': {'mimetype': 'audio/flac', 'ffmpeg': ['-c:a', 'flac', '-f', 'flac']},
+        'mp3': {'mimetype': 'audio/mpeg', 'ffmpeg': ['-c:a', 'libmp3lame', '-b:a', '64k', '-f', 'mp3']},
+        'opus': {'mimetype': 'audio/ogg', 'ffmpeg': ['-c:a', 'libopus', '-b:a', '32k', '-ar', '48000', '-f', 'ogg']},
+        'aac': {'mimetype': 'audio/aac', 'ffmpeg': ['-c:a', 'aac', '-b:a', '64k', '-f', 'adts']},
+    }
+
+    # pcm has no header to carry its rate, it is always sent at the rate OpenAI clients expect
+    pcm_rate = 24000
+
+    @staticmethod
+    def set_vars(logger, ffmpeg_path):
+
+        Encoder.logger = logger
+        Encoder.ffmpeg_path = ffmpeg_path
+
+    @staticmethod
+    def mimetype(audio_format):
+
+        return Encoder.formats[audio_format]['mimetype']
+
+    @staticmethod
+    def mimetype_for_file(filename):
+
+        extension = filename.rsplit('.', 1)[-1].lower()
+        return Encoder.formats[extension]['mimetype'] if extension in Encoder.formats else 'application/octet-stream'
+
+    @staticmethod
+    def ffmpeg_command(audio_format, sampling_rate):
+
+        return [
+            Encoder.ffmpeg_path, '-hide_banner', '-loglevel', 'error',
+            '-f', 's16le', '-ar', str(sampling_rate), '-ac', '1', '-i', 'pipe:0',
+        ] + Encoder.formats[audio_format]['ffmpeg'] + ['pipe:1']
+
+    @staticmethod
+    def encode(audio, sampling_rate, audio_format):
+
+        if audio_format == 'wav':
+            return Audio.to_wav(audio, sampling_rate)
+
+        if audio_format == 'pcm':
+            return Audio.to_pcm16(Audio.resample(audio, sampling_rate, Encoder.pcm_rate))
+
+        if audio_format == 'flac':
+            buffer = io.BytesIO()
+            soundfile.write(buffer, audio, sampling_rate, format='FLAC', subtype='PCM_16')
+            return buffer.getvalue()
+
+        result = subprocess.run(Encoder.ffmpeg_command(audio_format, sampling_rate), input=Audio.to_pcm16(audio), capture_output=True)
+
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed to encode {audio_format}: {result.stderr.decode('utf-8', 'ignore').strip()}")
+
+        return result.stdout
+
+    @staticmethod
+    async def encode_async(audio, sampling_rate, audio_format):
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, Encoder.encode, audio, sampling_rate, audio_format)
+
+    @staticmethod
+    async def encode_stream(audio_format, segments):
+
+        # segments is an async iterator of (audio, sampling_rate), encoded bytes are
+        # yielded as soon as the encoder produces them
+        if audio_format == 'pcm':
+            loop = asyncio.get_running_loop()
+
+            async for audio, sampling_rate in segments:
+                yield await loop.run_in_executor(None, Encoder.encode, audio, sampling_rate, audio_format)
+
+            return
+
+        if Encoder.formats[audio_format]['ffmpeg'] is None:
+            header_sent = False
+
+            async for audio, sampling_rate in segments:
+
+                if not header_sent:
+                    yield Audio.wav_header(sampling_rate)
+                    header_sent = True
+
+                yield Audio.to_pcm16(audio)
+
+            return
+
+        process = None
+        output = bytearray()
+
+        async def pump():
+            while True:
+                data = await process.stdout.read(64 * 1024)
+                if not data:
+                    break
+                output.extend(data)
+
+        try:
+            async for audio, sampling_rate in segments:
+
+                if process is None:
+                    process = await asyncio.create_subprocess_exec(
+                        *Encoder.ffmpeg_command(audio_format, sampling_rate),
+                        stdin=asyncio.subprocess.PIPE,
+                        stdout=asyncio.subprocess.PIPE,
+                        stderr=asyncio.subprocess.DEVNULL,
+                    )
+                    reader = asyncio.ensure_future(pump())
+
+                process.stdin.write(Audio.to_pcm16(audio))
+                await process.stdin.drain()
+                # Give the encoder a chance to flush what it already has for this segment
+                await asyncio.sleep(0)
+
+                if output:
+                    yield bytes(output)
+                    output.clear()
+
+            if process is not None:
+                process.stdin.close()
+                await reader
+                await process.wait()
+
+                if output:
+                    yield bytes(output)
+
+        finally:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
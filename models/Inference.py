@@ -0,0 +1,93 @@
+import asyncio, functools
+from concurrent.futures import ThreadPoolExecutor
+from models.Precision import Precision
+from models.Profiler import Profiler
+
+class Inference:
+
+    @staticmethod
+    def set_vars(logger, workers, max_in_flight):
+
+        Inference.logger = logger
+        Inference.workers = workers
+        Inference.max_in_flight = max_in_flight
+        Inference.executors = {}
+        Inference.semaphores = {}
+        Inference.queued = {}
+        Inference.running = {}
+
+    @staticmethod
+    def parse_limits(value, default):
+
+        # Accepts either a single number applied to every key ("2")
+        # or a comma separated list of key=number pairs ("cpu=4,cuda:0=1")
+        limits = {'default': default}
+
+        for item in str(value).split(','):
+            item = item.strip()
+
+            if not item:
+                continue
+
+            if '=' in item:
+                key, number = item.rsplit('=', 1)
+                limits[key.strip()] = int(number)
+            else:
+                limits['default'] = int(item)
+
+        return limits
+
+    @staticmethod
+    def stats():
+
+        return {model_key: {'queued': Inference.queued.get(model_key, 0), 'running': Inference.running.get(model_key, 0)} for model_key in Inference.semaphores}
+
+    @staticmethod
+    def get_executor(device):
+
+        if device not in Inference.executors:
+            workers = Inference.workers.get(device, Inference.workers['default'])
+            Inference.logger.debug(f' > Starting inference pool for device {device} with {workers} worker(s)')
+            Inference.executors[device] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'inference-{device}')
+
+        return Inference.executors[device]
+
+    @staticmethod
+    def get_semaphore(model_key):
+
+        if model_key not in Inference.semaphores:
+            family = model_key.split(':')[0]
+            limit = Inference.max_in_flight.get(model_key, Inference.max_in_flight.get(family, Inference.max_in_flight['default']))
+            Inference.semaphores[model_key] = asyncio.Semaphore(limit)
+
+        return Inference.semaphores[model_key]
+
+    @staticmethod
+    async def run(device, model_key, func, *args, **kwargs):
+
+        loop = asyncio.get_running_loop()
+        session = Profiler.current.get()
+        semaphore = Inference.get_semaphore(model_key)
+        Inference.queued[model_key] = Inference.queued.get(model_key, 0) + 1
+
+        try:
+            await semaphore.acquire()
+        finally:
+            Inference.queued[model_key] -= 1
+
+        Inference.running[model_key] = Inference.running.get(model_key, 0) + 1
+
+        try:
+            return await loop.run_in_executor(Inference.get_executor(device), functools.partial(Profiler.call, session, model_key, Precision.call, model_key, func, *args, **kwargs))
+        finally:
+            Inference.running[model_key] -= 1
+            semaphore.release()
+
+    @staticmethod
+    def shutdown():
+
+        for device, executor in Inference.executors.items():
+            Inference.logger.debug(f' > Stopping inference pool for device {device}')
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        Inference.executors = {}
@@ -0,0 +1,254 @@
+import time, threading, contextvars, contextlib
+from models.Inference import Inference
+from models.Cache import Cache
+from models.Storage import Storage
+from models.Registry import Registry
+from models.Profiler import Profiler
+from models.Admission import Admission
+from models.Embedding import Embedding
+from models.SpeakerStore import SpeakerStore
+from models.Speakers import Speakers
+
+class Metrics:
+
+    buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+    current = contextvars.ContextVar('metrics_request', default=None)
+    descriptions = {
+        'openvoice_request_duration_seconds': 'Time to produce the response headers',
+        'openvoice_stage_duration_seconds': 'Time spent in each stage of the audio pipeline',
+        'openvoice_requests_total': 'Finished requests',
+        'openvoice_cancelled_requests_total': 'Requests whose synthesis was stopped by their deadline or a client disconnect',
+    }
+
+    @staticmethod
+    def set_vars(logger):
+
+        Metrics.logger = logger
+        Metrics.histograms = {}
+        Metrics.counters = {}
+        Metrics.in_flight = 0
+        Metrics.lock = threading.Lock()
+
+    @staticmethod
+    def start_request():
+
+        Metrics.current.set({'start': time.perf_counter(), 'stages': {}, 'labels': {}})
+        Metrics.in_flight += 1
+
+    @staticmethod
+    def end_request():
+
+        # The state is kept, the stages of a streamed body still run after the teardown
+        state = Metrics.current.get()
+
+        if state is not None and not state.get('ended'):
+            state['ended'] = True
+            Metrics.in_flight -= 1
+
+    @staticmethod
+    def label(**labels):
+
+        state = Metrics.current.get()
+
+        if state is not None:
+            state['labels'].update(labels)
+
+    @staticmethod
+    @contextlib.contextmanager
+    def stage(name):
+
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            Metrics.record_stage(name, time.perf_counter() - start)
+
+    @staticmethod
+    def record_stage(name, seconds):
+
+        # Stages are observed as soon as they end, so the ones running while a
+        # streamed body is sent are counted too, even if they miss the header
+        state = Metrics.current.get()
+        labels = {}
+
+        if state is not None:
+            state['stages'][name] = state['stages'].get(name, 0) + seconds
+            labels = {key: state['labels'][key] for key in ('version', 'language') if key in state['labels']}
+
+        Metrics.observe('openvoice_stage_duration_seconds', seconds, stage=name, **labels)
+
+    @staticmethod
+    def server_timing():
+
+        state = Metrics.current.get()
+
+        if state is None:
+            return None
+
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in state['stages'].items()]
+        entries.append(f"total;dur={(time.perf_counter() - state['start']) * 1000:.1f}")
+        return ', '.join(entries)
+
+    @staticmethod
+    def finish(endpoint, status):
+
+        state = Metrics.current.get()
+
+        if state is None:
+            return
+
+        labels = {key: state['labels'].get(key, '') for key in ('version', 'language', 'voice', 'response_format')}
+
+        # Registered voices can number in the thousands, they share one label value
+        if labels['voice'] not in ('', 'raw') and labels['voice'] not in Speakers.builtin:
+            labels['voice'] = 'registered'
+
+        Metrics.observe('openvoice_request_duration_seconds', time.perf_counter() - state['start'], endpoint=endpoint, **labels)
+        Metrics.inc('openvoice_requests_total', endpoint=endpoint, status=str(status))
+
+    @staticmethod
+    def key(name, labels):
+
+        return name, tuple(sorted(labels.items()))
+
+    @staticmethod
+    def observe(name, value, **labels):
+
+        key = Metrics.key(name, labels)
+
+        with Metrics.lock:
+            histogram = Metrics.histograms.setdefault(key, {'buckets': [0] * len(Metrics.buckets), 'sum': 0.0, 'count': 0})
+
+            for i, bound in enumerate(Metrics.buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @staticmethod
+    def inc(name, value=1, **labels):
+
+        key = Metrics.key(name, labels)
+
+        with Metrics.lock:
+            Metrics.counters[key] = Metrics.counters.get(key, 0) + value
+
+    @staticmethod
+    def format_labels(labels):
+
+        if not labels:
+            return ''
+
+        escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    @staticmethod
+    def header(lines, name, metric_type, seen):
+
+        if name not in seen:
+            seen.add(name)
+            lines.append(f"# HELP {name} {Metrics.descriptions.get(name, name.replace('_', ' '))}")
+            lines.append(f'# TYPE {name} {metric_type}')
+
+    @staticmethod
+    def families(values):
+
+        # The exposition format needs the samples of a family in one block under its TYPE line
+        families = {}
+
+        for name, labels, value in values:
+            families.setdefault(name, []).append((labels, value))
+
+        return families
+
+    @staticmethod
+    def gauges():
+
+        # Values read from the other components when /metrics is scraped
+        values = [('openvoice_requests_in_flight', (), Metrics.in_flight)]
+
+        for model_key, state in Inference.stats().items():
+            values.append(('openvoice_inference_queued', (('model', model_key),), state['queued']))
+            values.append(('openvoice_inference_running', (('model', model_key),), state['running']))
+
+        for key, state in Admission.stats().items():
+            values.append(('openvoice_admission_active', (('model', key),), state['active']))
+            values.append(('openvoice_admission_queued', (('model', key),), state['queued']))
+
+        cache = Cache.stats()
+        lookups = cache['memory_hits'] + cache['disk_hits'] + cache['misses']
+        values.append(('openvoice_result_cache_hit_ratio', (), (cache['memory_hits'] + cache['disk_hits']) / lookups if lookups else 0))
+        values.append(('openvoice_result_cache_bytes', (('tier', 'memory'),), cache['memory_bytes']))
+        values.append(('openvoice_result_cache_bytes', (('tier', 'disk'),), cache['disk_bytes']))
+
+        models = Registry.stats()
+
+        for model in models['loaded']:
+            values.append(('openvoice_model_loaded', (('model', model),), 1))
+
+        values.append(('openvoice_model_bytes', (), models['bytes']))
+
+        speakers = SpeakerStore.stats()
+        values.append(('openvoice_speaker_hot_voices', (), speakers['hot']))
+
+        for version, count in speakers['voices'].items():
+            values.append(('openvoice_speaker_voices', (('version', version),), count))
+
+        storage = Storage.stats()
+        values.append(('openvoice_audio_files', (), storage['files']))
+        values.append(('openvoice_audio_files_bytes', (), storage['bytes']))
+        return values
+
+    @staticmethod
+    def totals():
+
+        cache = Cache.stats()
+        models = Registry.stats()
+        storage = Storage.stats()
+        values = [('openvoice_result_cache_events_total', (('event', event),), cache[event]) for event in ('memory_hits', 'disk_hits', 'misses', 'coalesced', 'evictions')]
+        values += [('openvoice_model_loads_total', (), models['loads']), ('openvoice_model_evictions_total', (), models['evictions'])]
+        values += [('openvoice_audio_files_evictions_total', (('reason', reason),), storage[f'{reason}_evictions']) for reason in ('ttl', 'size')]
+        values.append(('openvoice_profiled_requests_total', (), Profiler.counters['profiled']))
+        values += [('openvoice_upload_se_cache_events_total', (('event', event),), Embedding.counters[f'upload_{event}']) for event in ('hits', 'misses')]
+        values += [('openvoice_speaker_hot_events_total', (('event', event),), SpeakerStore.counters[f'hot_{event}']) for event in ('hits', 'misses')]
+
+        for key, state in Admission.stats().items():
+            values.append(('openvoice_admission_rejected_total', (('model', key), ('reason', 'queue_full')), state['rejected']))
+            values.append(('openvoice_admission_rejected_total', (('model', key), ('reason', 'queue_timeout')), state['timeouts']))
+
+        return values
+
+    @staticmethod
+    def render():
+
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        seen = set()
+
+        with Metrics.lock:
+            histograms = {key: {'buckets': list(value['buckets']), 'sum': value['sum'], 'count': value['count']} for key, value in Metrics.histograms.items()}
+            counters = dict(Metrics.counters)
+
+        for (name, labels), histogram in sorted(histograms.items()):
+            Metrics.header(lines, name, 'histogram', seen)
+
+            for bound, count in zip(Metrics.buckets, histogram['buckets']):
+                lines.append(f"{name}_bucket{Metrics.format_labels(labels + (('le', str(bound)),))} {count}")
+
+            lines.append(f"{name}_bucket{Metrics.format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+            lines.append(f"{name}_sum{Metrics.format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{name}_count{Metrics.format_labels(labels)} {histogram['count']}")
+
+        counter_values = [(name, labels, value) for (name, labels), value in sorted(counters.items())] + Metrics.totals()
+
+        for metric_type, values in (('counter', counter_values), ('gauge', Metrics.gauges())):
+
+            for name, samples in Metrics.families(values).items():
+                Metrics.header(lines, name, metric_type, seen)
+
+                for labels, value in samples:
+                    lines.append(f'{name}{Metrics.format_labels(labels)} {value}')
+
+        return '\n'.join(lines) + '\n'
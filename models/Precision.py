@@ -0,0 +1,161 @@
+import contextlib, torch
+import numpy as np
+
+class Precision:
+
+    modes = ['fp32', 'bf16', 'int8']
+
+    # Short phrases used to compare a reduced precision model against its fp32 output
+    sample_texts = {
+        'EN': 'The quick brown fox jumps over the lazy dog.',
+        'ES': 'El veloz zorro marrón salta sobre el perro perezoso.',
+        'FR': 'Le rapide renard brun saute par-dessus le chien paresseux.',
+        'ZH': '敏捷的棕色狐狸跳过了那只懒狗。',
+        'JP': '素早い茶色の狐が怠け者の犬を飛び越えた。',
+        'KR': '빠른 갈색 여우가 게으른 개를 뛰어넘었다.',
+    }
+
+    @staticmethod
+    def set_vars(logger, modes, tolerance):
+
+        for version, mode in modes.items():
+            if mode not in Precision.modes:
+                raise ValueError(f"Invalid precision {mode} for {version}, supported values are {', '.join(Precision.modes)}")
+
+        Precision.logger = logger
+        Precision.requested = modes
+        Precision.tolerance = tolerance
+        Precision.active = {}
+
+    @staticmethod
+    def stats():
+
+        return {model_key: mode for model_key, (mode, device_type) in Precision.active.items()}
+
+    @staticmethod
+    def mode(model_key, version):
+
+        # The mode a model runs in, or the configured one while it is not loaded yet
+        if model_key in Precision.active:
+            return Precision.active[model_key][0]
+
+        return Precision.requested.get(version, 'fp32')
+
+    @staticmethod
+    def context(model_key):
+
+        mode, device_type = Precision.active.get(model_key, ('fp32', 'cpu'))
+
+        if mode == 'bf16':
+            return torch.autocast(device_type, dtype=torch.bfloat16)
+
+        return contextlib.nullcontext()
+
+    @staticmethod
+    def call(model_key, func, *args, **kwargs):
+
+        # Autocast state is thread local, so it is entered in the thread running the model
+        with Precision.context(model_key):
+            return func(*args, **kwargs)
+
+    @staticmethod
+    def quantize(module, keep=()):
+
+        # Dynamic quantization covers nn.Linear only, convolutions keep running in fp32. The
+        # submodules named in keep stay in fp32 as well
+        quantized = torch.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+        for name in keep:
+            setattr(quantized, name, getattr(module, name))
+
+        return quantized
+
+    @staticmethod
+    def spectrum(audio):
+
+        audio = torch.from_numpy(np.ascontiguousarray(audio, dtype=np.float32))
+        magnitude = torch.stft(audio, n_fft=1024, hop_length=256, window=torch.hann_window(1024), return_complex=True).abs()
+        return torch.log(magnitude.mean(-1) + 1e-5)
+
+    @staticmethod
+    def distance(reference, candidate):
+
+        # Timing can shift slightly between precisions, so the comparison uses the
+        # time averaged log spectrum and the duration instead of the raw samples
+        length = abs(len(candidate) - len(reference)) / max(len(reference), 1)
+        reference_spectrum = Precision.spectrum(reference)
+        candidate_spectrum = Precision.spectrum(candidate)
+        spectral = (torch.norm(candidate_spectrum - reference_spectrum) / torch.norm(reference_spectrum)).item()
+        return max(length, spectral)
+
+    @staticmethod
+    def sample_tts(model, version, language):
+
+        text = Precision.sample_texts.get(language, Precision.sample_texts['EN'])
+
+        if version == 'v1':
+            language_name = next(name for name, mark in model.language_marks.items() if mark == language)
+            return model.tts(text, None, speaker='default', language=language_name.capitalize())
+
+        speaker_id = list(model.hps.data.spk2id.values())[0]
+        return model.tts_to_file(text, speaker_id, None, quiet=True)
+
+    @staticmethod
+    def sample_conversion(converter):
+
+        hps = converter.hps
+        spec = torch.rand(1, hps.data.filter_length // 2 + 1, 200, device=converter.device)
+        spec_lengths = torch.LongTensor([spec.size(-1)]).to(converter.device)
+        se = torch.randn(1, hps.model.gin_channels, 1, device=converter.device)
+
+        with torch.no_grad():
+            return converter.model.voice_conversion(spec, spec_lengths, sid_src=se, sid_tgt=se * 0.5)[0][0, 0].data.cpu().float().numpy()
+
+    @staticmethod
+    def run_seeded(model_key, func):
+
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(0)
+            return Precision.call(model_key, func)
+
+    @staticmethod
+    def apply(model_key, version, wrapper, sample, keep=()):
+
+        # Switches wrapper.model to the precision configured for the version and keeps it
+        # only if its output on a fixed sample stays within tolerance of the fp32 output,
+        # the submodules named in keep are not quantized
+        mode = Precision.requested.get(version, 'fp32')
+        device_type = torch.device(wrapper.device).type
+        Precision.active[model_key] = ('fp32', device_type)
+
+        if mode == 'fp32':
+            return
+
+        if mode == 'int8' and device_type != 'cpu':
+            Precision.logger.warning(f" > int8 quantization is only available on cpu, {model_key} stays in fp32")
+            return
+
+        reference = Precision.run_seeded(model_key, sample)
+        original = wrapper.model
+
+        if mode == 'int8':
+            wrapper.model = Precision.quantize(original, keep)
+
+        Precision.active[model_key] = (mode, device_type)
+
+        try:
+            distance = Precision.distance(reference, Precision.run_seeded(model_key, sample))
+        except Exception as e:
+            Precision.logger.warning(f" > {mode} failed on {model_key}, falling back to fp32: {e}")
+            distance = None
+
+        if distance is None or distance > Precision.tolerance:
+
+            if distance is not None:
+                Precision.logger.warning(f" > {mode} output of {model_key} is {distance:.4f} away from fp32 (tolerance {Precision.tolerance}), falling back to fp32")
+
+            wrapper.model = original
+            Precision.active[model_key] = ('fp32', device_type)
+            return
+
+        Precision.logger.info(f" > Running {model_key} in {mode} ({distance:.4f} away from fp32)")
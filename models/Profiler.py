@@ -0,0 +1,100 @@
+import os, hmac, random, itertools, contextvars, cProfile, torch
+from datetime import datetime
+from uuid import uuid4
+
+class Profiler:
+
+    current = contextvars.ContextVar('profiler_session', default=None)
+
+    @staticmethod
+    def set_vars(logger, path, token, sample_rate):
+
+        Profiler.logger = logger
+        Profiler.path = path
+        Profiler.token = token
+        Profiler.sample_rate = sample_rate
+        Profiler.counters = {'profiled': 0}
+
+    @staticmethod
+    def enabled():
+
+        return bool(Profiler.token) or Profiler.sample_rate > 0
+
+    @staticmethod
+    def start(headers):
+
+        # Requests are profiled when they carry the admin token or are picked by the sampling rate
+        if not Profiler.enabled():
+            return None
+
+        token = headers.get('X-Profile-Token')
+        requested = bool(Profiler.token) and token is not None and hmac.compare_digest(token, Profiler.token)
+
+        if not requested and random.random() >= Profiler.sample_rate:
+            return None
+
+        session = {
+            'id': f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}_{uuid4().hex[:8]}",
+            'counter': itertools.count(1),
+            'files': [],
+        }
+        Profiler.current.set(session)
+        Profiler.counters['profiled'] += 1
+        return session
+
+    @staticmethod
+    def headers():
+
+        session = Profiler.current.get()
+
+        if session is None:
+            return {}
+
+        # Model calls of a streamed body end after the headers are sent, their files
+        # share the same id prefix
+        return {'X-Profile-Id': session['id'], 'X-Profile-Files': ', '.join(session['files'])}
+
+    @staticmethod
+    def call(session, name, func, *args, **kwargs):
+
+        # Runs in the inference thread, so the profilers only see the work of this request
+        if session is None:
+            return func(*args, **kwargs)
+
+        name = f"{session['id']}_{next(session['counter'])}_{name.replace(':', '-')}"
+        activities = [torch.profiler.ProfilerActivity.CPU]
+
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+
+        profile = cProfile.Profile()
+        trace = None
+
+        try:
+            with torch.profiler.profile(activities=activities, record_shapes=True) as trace:
+                profile.enable()
+
+                try:
+                    result = func(*args, **kwargs)
+                finally:
+                    profile.disable()
+        finally:
+            Profiler.save(session, name, profile, trace)
+
+        return result
+
+    @staticmethod
+    def save(session, name, profile, trace):
+
+        try:
+            os.makedirs(Profiler.path, exist_ok=True)
+            profile.dump_stats(f'{Profiler.path}/{name}.pstats')
+            session['files'].append(f'{name}.pstats')
+
+            if trace is not None:
+                trace.export_chrome_trace(f'{Profiler.path}/{name}.json')
+                session['files'].append(f'{name}.json')
+
+            Profiler.logger.debug(f' > Saved profile {name} to {Profiler.path}')
+        except Exception as e:
+            Profiler.logger.warning(f' > Could not save profile {name}: {e}')
@@ -0,0 +1,137 @@
+import asyncio, threading, gc, torch
+from collections import OrderedDict
+from openvoice.api import BaseSpeakerTTS
+from melo.api import TTS
+from models.Precision import Precision
+
+class Registry:
+
+    @staticmethod
+    def set_vars(logger, ckpt_base, devices, memory_budget):
+
+        Registry.logger = logger
+        Registry.ckpt_base = ckpt_base
+        Registry.devices = devices
+        Registry.memory_budget = memory_budget
+        Registry.loaded = OrderedDict()
+        Registry.sizes = {}
+        Registry.known_sizes = {}
+        Registry.locks = {}
+        Registry.mutex = threading.RLock()
+        Registry.counters = {'loads': 0, 'evictions': 0}
+
+    @staticmethod
+    def model_size(model):
+
+        # From the state dict rather than parameters() and buffers(), int8 Linear layers keep
+        # their weights in _packed_params, which is neither. Shared tensors are counted once
+        tensors = {}
+
+        for value in model.model.state_dict(keep_vars=True).values():
+
+            for tensor in (value if isinstance(value, tuple) else (value,)):
+
+                if isinstance(tensor, torch.Tensor):
+                    tensors[id(tensor)] = tensor
+
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors.values())
+
+    @staticmethod
+    def stats():
+
+        with Registry.mutex:
+            return {
+                'loaded': [f'{version}:{language}' for version, language in Registry.loaded],
+                'bytes': sum(Registry.sizes.values()),
+                'budget_bytes': Registry.memory_budget,
+                **Registry.counters,
+            }
+
+    @staticmethod
+    def is_loaded(version, language):
+
+        return (version, language) in Registry.loaded
+
+    @staticmethod
+    def create(version, language):
+
+        if version == 'v1':
+            model = BaseSpeakerTTS(f"{Registry.ckpt_base[language]}/config.json", device=Registry.devices['v1'])
+            model.load_ckpt(f"{Registry.ckpt_base[language]}/checkpoint.pth")
+        else:
+            model = TTS(language=language, device=Registry.devices['v2'])
+
+        Precision.apply(f'tts_{version}:{language}', version, model, lambda: Precision.sample_tts(model, version, language))
+        return model
+
+    @staticmethod
+    def get(version, language):
+
+        key = (version, language)
+
+        with Registry.mutex:
+
+            if key in Registry.loaded:
+                Registry.loaded.move_to_end(key)
+                return Registry.loaded[key]
+
+            # Free room up front when the size of this model is known from a previous load
+            Registry.evict(Registry.known_sizes.get(key, 0))
+
+        Registry.logger.info(f" > Loading {version} model for {language}")
+        model = Registry.create(version, language)
+        size = Registry.model_size(model)
+
+        with Registry.mutex:
+            Registry.evict(size)
+            Registry.loaded[key] = model
+            Registry.sizes[key] = size
+            Registry.known_sizes[key] = size
+            Registry.counters['loads'] += 1
+
+        Registry.logger.info(f" > Loaded {version} model for {language} ({size} bytes)")
+        return model
+
+    @staticmethod
+    async def acquire(version, language):
+
+        key = (version, language)
+
+        with Registry.mutex:
+
+            if key in Registry.loaded:
+                Registry.loaded.move_to_end(key)
+                return Registry.loaded[key]
+
+        lock = Registry.locks.setdefault(key, asyncio.Lock())
+
+        async with lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, Registry.get, version, language)
+
+    @staticmethod
+    def evict(incoming):
+
+        if Registry.memory_budget <= 0:
+            return
+
+        evicted = False
+
+        while Registry.loaded and sum(Registry.sizes.values()) + incoming > Registry.memory_budget:
+            (version, language), model = Registry.loaded.popitem(last=False)
+            del Registry.sizes[(version, language)]
+            Registry.counters['evictions'] += 1
+            Registry.logger.info(f" > Evicted {version} model for {language} to stay within the memory budget")
+            evicted = True
+
+        if evicted:
+            gc.collect()
+
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+
+    @staticmethod
+    def preload(items):
+
+        for version, language in items:
+            Registry.get(version, language)
@@ -1,12 +1,12 @@
-import magic, base64
+import re, magic, base64
 from models.Response import Response
+from models.Upload import Upload
     
 class Request:
 
     @staticmethod
-    def set_vars(models, model_languages_v1, model_languages_v2, speakers, model_language_names_v1, styles_v1, supported_styles_v1, speaker_ids, reference_speakers):
+    def set_vars(model_languages_v1, model_languages_v2, speakers, model_language_names_v1, styles_v1, supported_styles_v1, speaker_ids, reference_speakers, upload_max_bytes=0):
 
-        Request.models = models
         Request.model_languages_v1 = model_languages_v1
         Request.model_languages_v2 = model_languages_v2
         Request.speakers = speakers
@@ -16,31 +16,58 @@ class Request:
         Request.speaker_ids = speaker_ids
         Request.reference_speakers = reference_speakers
         Request.openvoice_versions = ['v1', 'v2']
-        Request.valid_generate_audio_params = ['model', 'speed', 'input', 'response_format', 'voice']
+        Request.valid_generate_audio_params = ['model', 'speed', 'input', 'response_format', 'voice', 'audio_format']
         Request.valid_change_voice_mime_types = {'mp3': 'audio/mpeg', 'wav': 'audio/wav'}
         Request.valid_response_formats = ['url', 'bytes', 'stream', 'base64']
+        Request.valid_audio_formats = ['wav', 'mp3', 'opus', 'aac', 'flac', 'pcm']
+        Request.upload_max_bytes = upload_max_bytes
+        Request.magic = magic.Magic(mime=True)
+        Request.voice_name_pattern = re.compile(r'^[a-z0-9_-]{1,64}$')
 
     @staticmethod
-    async def validate_change_voice_request(args):
+    def list_voices(limit=20):
 
+        # There can be thousands of registered voices, the error message only lists the first ones
+        voices = sorted(Request.speakers)
+        more = f", ... ({len(voices) - limit} more)" if len(voices) > limit else ''
+        return ', '.join(voices[:limit]) + more + ', raw'
+
+    @staticmethod
+    def sniff_mime_type(header):
+
+        # Only the leading bytes of the upload are looked at
+        if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+            return 'audio/wav'
+
+        if header[:3] == b'ID3' or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+            return 'audio/mpeg'
+
+        mime_type = Request.magic.from_buffer(header)
+        return 'audio/wav' if mime_type == 'audio/x-wav' else mime_type
+
+    @staticmethod
+    async def validate_audio_data(args, upload=None):
+
+        # upload is set for multipart and raw audio bodies, json bodies carry base64 audio_data
         args.setdefault('audio_data', None)
         audio_data = args.pop('audio_data')
         
-        if audio_data is None or audio_data == '':
+        if upload is None and (audio_data is None or audio_data == ''):
             error_message = "Parameter 'audio_data' is required"
             payload_response = Response.payload(False, 400, error_message)
             return payload_response
         
         try:
-            audio_bytes = base64.b64decode(audio_data)
-            mime = magic.Magic(mime=True)
-            mime_type = mime.from_buffer(audio_bytes)
+            if upload is None:
+                upload = Upload.from_bytes(base64.b64decode(audio_data))
+            mime_type = Request.sniff_mime_type(upload.header)
         except Exception as e:
             payload_response = Response.payload(False, 400, "Invalid base64 audio data")
             return payload_response
-        
-        if (mime_type == 'audio/x-wav'):
-            mime_type = 'audio/wav'
+
+        if Request.upload_max_bytes and upload.size > Request.upload_max_bytes:
+            payload_response = Response.payload(False, 413, f"Audio data is larger than {Request.upload_max_bytes} bytes")
+            return payload_response
         
         file_extension = None
         for ext, mime_val in Request.valid_change_voice_mime_types.items():
@@ -53,6 +80,20 @@ class Request:
             error_message = f"Unsupported audio file type: {mime_type}, valid extensions are: {', '.join(Request.valid_change_voice_mime_types.keys())}"
             payload_response = Response.payload(False, 400, error_message, {})
             return payload_response
+
+        upload.extension = file_extension
+        args['audio'] = upload
+        args['file_extension'] = file_extension
+
+        return {}
+
+    @staticmethod
+    async def validate_change_voice_request(args, upload=None):
+
+        validation_result = await Request.validate_audio_data(args, upload)
+
+        if validation_result:
+            return validation_result
         
         text = args.get('input', None)
 
@@ -90,17 +131,34 @@ class Request:
             payload_response = Response.payload(False, 400, error_message)
             return payload_response
         
-        args['audio_bytes'] = audio_bytes
-        args['file_extension'] = file_extension
         args.setdefault('input', '__AUDIO_DATA__')
 
         return {}
 
+    @staticmethod
+    async def validate_register_voice_request(args, upload=None):
+
+        name = str(args.get('name') or '').lower()
+
+        if not Request.voice_name_pattern.match(name) or name == 'raw':
+            error_message = "Parameter 'name' is required and may only contain 1 to 64 lowercase letters, digits, '-' and '_'"
+            payload_response = Response.payload(False, 400, error_message)
+            return payload_response
+
+        if name in Request.reference_speakers:
+            payload_response = Response.payload(False, 409, f"Voice '{name}' already exists")
+            return payload_response
+
+        args['name'] = name
+        return await Request.validate_audio_data(args, upload)
+
     @staticmethod
     async def validate_generate_audio_request(args, version, isOpenAI=False):
 
-        args.setdefault('response_format', 'url')
+        # The OpenAI endpoint takes an audio format as response_format, mp3 by default like OpenAI
+        args.setdefault('response_format', 'mp3' if isOpenAI else 'url')
         args.setdefault('speed', 1.0)
+        args.setdefault('audio_format', 'wav')
 
         valid_generate_audio_params = Request.valid_generate_audio_params.copy()
 
@@ -140,17 +198,25 @@ class Request:
         
         raw_response_format = args.get('response_format')
         response_format = raw_response_format.lower()
-        valid_response_formats = Request.valid_response_formats if not isOpenAI else ['wav']
+        valid_response_formats = Request.valid_response_formats if not isOpenAI else Request.valid_audio_formats
         
         if response_format not in valid_response_formats:
             error_message = f"Invalid response_format sent '{raw_response_format}', valid params are: {', '.join(valid_response_formats)}"
             payload_response = Response.payload(False, 400, error_message)
             return payload_response
 
+        raw_audio_format = args.get('audio_format')
+        audio_format = str(raw_audio_format).lower()
+
+        if audio_format not in Request.valid_audio_formats:
+            error_message = f"Invalid audio_format sent '{raw_audio_format}', valid params are: {', '.join(Request.valid_audio_formats)}"
+            payload_response = Response.payload(False, 400, error_message)
+            return payload_response
+
         raw_lang = args.get('model')
         language = raw_lang.upper()
 
-        if (version == 'v1' and language not in Request.model_languages_v1) or (version == 'v2' and language not in Request.models):
+        if (version == 'v1' and language not in Request.model_languages_v1) or (version == 'v2' and language not in Request.speaker_ids):
 
             if version == 'v1':
                 valid_lang_keys = ", ".join(Request.model_languages_v1).lower()
@@ -193,8 +259,7 @@ class Request:
         speaker = args.get('voice').lower()
 
         if speaker not in Request.speakers and speaker != 'raw':
-            joined_keys = ' '.join(Request.speakers) + ", raw"
-            error_message = f"Invalid voice '{speaker}', valid values are: " + joined_keys
+            error_message = f"Invalid voice '{speaker}', valid values are: " + Request.list_voices()
             payload_response = Response.payload(False, 400, error_message)
             return payload_response
         
@@ -249,7 +314,7 @@ class Request:
         speaker = args.get('voice').lower()
 
         if speaker not in Request.reference_speakers and speaker != 'raw':
-            error_message = f"Invalid voice '{speaker}', valid values are: " + ", ".join(Request.reference_speakers) + ", raw"
+            error_message = f"Invalid voice '{speaker}', valid values are: " + Request.list_voices()
             payload_response = Response.payload(False, 400, error_message)
             return payload_response
         
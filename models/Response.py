@@ -1,6 +1,7 @@
-import json
-from quart import jsonify, make_response
-from datetime import datetime
+import json, os, asyncio
+from quart import jsonify, make_response, Response as QuartResponse
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 
 class Response:
     @staticmethod
@@ -51,3 +52,110 @@ class Response:
         if headers:
             response.headers['Content-Type'] = headers
         return response
+
+    @staticmethod
+    async def send_file(request, path, mimetype, cache_control='no-cache', sendfile_header=None, sendfile_path=None, chunk_size=64 * 1024):
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+        last_modified = datetime.fromtimestamp(int(stat.st_mtime), tz=timezone.utc)
+        headers = {
+            'Accept-Ranges': 'bytes',
+            'ETag': etag,
+            'Last-Modified': format_datetime(last_modified, usegmt=True),
+            'Cache-Control': cache_control,
+        }
+
+        if Response.not_modified(request, etag, last_modified):
+            return QuartResponse(b'', 304, headers=headers)
+
+        if sendfile_header:
+            # Let the front proxy send the file with sendfile(2), it handles ranges itself
+            headers[sendfile_header] = sendfile_path
+            return QuartResponse(b'', 200, headers=headers, mimetype=mimetype)
+
+        start, end, status = 0, size - 1, 200
+        byte_range = Response.parse_range(request.headers.get('Range'), size)
+        if_range = request.headers.get('If-Range')
+
+        if byte_range is not None and (if_range is None or if_range in (etag, headers['Last-Modified'])):
+
+            if byte_range is False:
+                headers['Content-Range'] = f'bytes */{size}'
+                return QuartResponse(b'', 416, headers=headers)
+
+            start, end = byte_range
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+        if request.method == 'HEAD':
+            response = QuartResponse(b'', status, headers=headers, mimetype=mimetype)
+        else:
+            response = QuartResponse(Response.read_file(path, start, end - start + 1, chunk_size), status, headers=headers, mimetype=mimetype)
+
+        response.headers['Content-Length'] = str(end - start + 1)
+        return response
+
+    @staticmethod
+    def parse_range(value, size):
+        # Returns (start, end) for a satisfiable single range, False for an unsatisfiable one
+        # and None when the header is missing or not supported (the whole file is sent)
+        if not value or not value.startswith('bytes=') or ',' in value:
+            return None
+
+        start, separator, end = value[6:].strip().partition('-')
+
+        try:
+            if start == '':
+                length = int(end)
+                return (max(size - length, 0), size - 1) if length > 0 and size > 0 else False
+
+            start = int(start)
+            end = int(end) if end else size - 1
+        except ValueError:
+            return None
+
+        if start >= size or end < start:
+            return False
+
+        return start, min(end, size - 1)
+
+    @staticmethod
+    def not_modified(request, etag, last_modified):
+        if_none_match = request.headers.get('If-None-Match')
+
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            tags = [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+            return '*' in tags or etag in tags
+
+        if_modified_since = request.headers.get('If-Modified-Since')
+
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+
+            return last_modified <= since
+
+        return False
+
+    @staticmethod
+    async def read_file(path, offset, length, chunk_size=64 * 1024):
+        loop = asyncio.get_running_loop()
+
+        with open(path, 'rb') as f:
+            f.seek(offset)
+
+            while length > 0:
+                data = await loop.run_in_executor(None, f.read, min(chunk_size, length))
+
+                if not data:
+                    break
+
+                length -= len(data)
+                yield data
@@ -0,0 +1,170 @@
+import os, json, fcntl, torch
+import numpy as np
+from collections import OrderedDict
+
+class SpeakerStore:
+
+    @staticmethod
+    def set_vars(logger, path, devices, hot_size):
+
+        # One packed float32 array per converter version ({version}.f32) and its id index
+        # ({version}.json). The array is memory mapped, so the workers share its pages
+        SpeakerStore.logger = logger
+        SpeakerStore.path = path
+        SpeakerStore.devices = devices
+        SpeakerStore.hot_size = hot_size
+        SpeakerStore.stores = {}
+        SpeakerStore.hot = OrderedDict()
+        SpeakerStore.counters = {'hot_hits': 0, 'hot_misses': 0}
+        os.makedirs(path, exist_ok=True)
+
+        for version in devices:
+            SpeakerStore.stores[version] = SpeakerStore.load(version)
+
+    @staticmethod
+    def stats():
+
+        return dict(SpeakerStore.counters, hot=len(SpeakerStore.hot), voices={version: len(store['ids']) for version, store in SpeakerStore.stores.items()})
+
+    @staticmethod
+    def index_path(version):
+
+        return f'{SpeakerStore.path}/{version}.json'
+
+    @staticmethod
+    def data_path(version):
+
+        return f'{SpeakerStore.path}/{version}.f32'
+
+    @staticmethod
+    def read_index(version):
+
+        try:
+            with open(SpeakerStore.index_path(version), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'shape': None, 'rows': 0, 'ids': {}}
+
+    @staticmethod
+    def mtime(version):
+
+        try:
+            return os.stat(SpeakerStore.index_path(version)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def load(version):
+
+        mtime = SpeakerStore.mtime(version)
+        index = SpeakerStore.read_index(version)
+        array = None
+
+        if index['rows'] > 0:
+            width = int(np.prod(index['shape']))
+            array = np.memmap(SpeakerStore.data_path(version), dtype=np.float32, mode='r', shape=(index['rows'], width))
+
+        return {'mtime': mtime, 'shape': index['shape'], 'ids': index['ids'], 'array': array}
+
+    @staticmethod
+    def refresh():
+
+        # Rows written by another worker are seen once its index replaced ours
+        for version, store in SpeakerStore.stores.items():
+
+            if SpeakerStore.mtime(version) != store['mtime']:
+                SpeakerStore.stores[version] = SpeakerStore.load(version)
+
+    @staticmethod
+    def has(version, name):
+
+        return version in SpeakerStore.stores and name in SpeakerStore.stores[version]['ids']
+
+    @staticmethod
+    def names(version):
+
+        return SpeakerStore.stores[version]['ids'].keys()
+
+    @staticmethod
+    def get(version, name):
+
+        # Hot voices stay on the device, keyed by row since a row is never rewritten
+        store = SpeakerStore.stores[version]
+        row = store['ids'][name]
+        key = (version, row)
+
+        if key in SpeakerStore.hot:
+            SpeakerStore.hot.move_to_end(key)
+            SpeakerStore.counters['hot_hits'] += 1
+            return SpeakerStore.hot[key]
+
+        SpeakerStore.counters['hot_misses'] += 1
+        se = torch.from_numpy(np.array(store['array'][row])).reshape(store['shape']).to(SpeakerStore.devices[version])
+        SpeakerStore.hot[key] = se
+
+        while len(SpeakerStore.hot) > SpeakerStore.hot_size:
+            SpeakerStore.hot.popitem(last=False)
+
+        return se
+
+    @staticmethod
+    def put(version, ses):
+
+        # Appends the embeddings that are new or changed. Rows are only appended, a deleted
+        # or replaced voice leaves its row behind, so readers never see a row change
+        with open(f'{SpeakerStore.path}/.{version}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = SpeakerStore.read_index(version)
+            current = SpeakerStore.load(version)['array']
+            rows = []
+
+            for name, se in ses.items():
+                vector = se.detach().cpu().float().numpy()
+
+                if index['shape'] is None:
+                    index['shape'] = list(vector.shape)
+
+                vector = vector.reshape(-1)
+
+                if name in index['ids'] and np.array_equal(current[index['ids'][name]], vector):
+                    continue
+
+                index['ids'][name] = index['rows'] + len(rows)
+                rows.append(vector)
+
+            if rows:
+                with open(SpeakerStore.data_path(version), 'ab') as f:
+                    f.truncate(index['rows'] * 4 * len(rows[0]))
+                    f.write(np.stack(rows).astype(np.float32).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                index['rows'] += len(rows)
+                SpeakerStore.write_index(version, index)
+
+        SpeakerStore.stores[version] = SpeakerStore.load(version)
+        return len(rows)
+
+    @staticmethod
+    def delete(version, names):
+
+        with open(f'{SpeakerStore.path}/.{version}.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = SpeakerStore.read_index(version)
+
+            for name in names:
+                index['ids'].pop(name, None)
+
+            SpeakerStore.write_index(version, index)
+
+        SpeakerStore.stores[version] = SpeakerStore.load(version)
+
+    @staticmethod
+    def write_index(version, index):
+
+        tmp_file = f'{SpeakerStore.index_path(version)}.{os.getpid()}.tmp'
+
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+
+        os.replace(tmp_file, SpeakerStore.index_path(version))
@@ -0,0 +1,277 @@
+import os, json, time, hmac, shutil, fcntl, asyncio
+from uuid import uuid4
+from models.Inference import Inference
+from models.Embedding import Embedding
+from models.SpeakerStore import SpeakerStore
+from models.Response import Response
+
+class Speakers:
+
+    @staticmethod
+    def set_vars(logger, path, token, converters, speakers, reference_speakers):
+
+        # speakers and reference_speakers are the objects used by the validators, they are
+        # updated in place, the SEs themselves are in the SpeakerStore
+        Speakers.logger = logger
+        Speakers.path = path
+        Speakers.token = token
+        Speakers.converters = {version: converter for version, converter in converters.items() if converter}
+        Speakers.speakers = speakers
+        Speakers.reference_speakers = reference_speakers
+        Speakers.builtin = set(reference_speakers)
+        Speakers.registered = {}
+        Speakers.pending = set()
+        Speakers.index_mtime = None
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def authorized(headers):
+
+        token = headers.get('X-Admin-Token')
+        return bool(Speakers.token) and token is not None and hmac.compare_digest(token, Speakers.token)
+
+    @staticmethod
+    def revision(name):
+
+        # Changes every time a name is registered, so a voice registered again under the same
+        # name never gets the results of the previous one
+        entry = Speakers.registered.get(name)
+        return entry['revision'] if entry else None
+
+    @staticmethod
+    def identity(version, name):
+
+        # Everything the target SE of a voice depends on, used in the result cache key so that a
+        # changed reference file, checkpoint or VAD setting never serves older audio
+        checkpoint_hash = Embedding.checkpoint_hashes.get(version, '')
+
+        if name in Speakers.registered:
+            return f"{Speakers.registered[name]['revision']}:{checkpoint_hash}:{str(Embedding.vad).lower()}"
+
+        return Embedding.target_keys.get((Speakers.reference_speakers.get(name), checkpoint_hash))
+
+    @staticmethod
+    def voices():
+
+        voices = [{'name': name, 'builtin': True, 'created': None} for name in sorted(Speakers.builtin)]
+        voices += [{'name': name, 'builtin': False, 'created': entry['created']} for name, entry in sorted(Speakers.registered.items())]
+
+        for voice in voices:
+            voice['versions'] = [version for version in Speakers.converters if SpeakerStore.has(version, voice['name'])]
+
+        return voices
+
+    @staticmethod
+    def index_path():
+
+        return f'{Speakers.path}/voices.json'
+
+    @staticmethod
+    def read_index():
+
+        try:
+            with open(Speakers.index_path(), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @staticmethod
+    def update_index(name, entry, ses=None):
+
+        # Read, change and replace the index under a lock shared by every worker, returns
+        # False when the name was registered by another worker in the meantime. The SEs are
+        # written to the store first, so a voice in the index always has its SEs
+        with open(f'{Speakers.path}/.lock', 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = Speakers.read_index()
+
+            if entry is not None and name in index:
+                return False
+
+            if entry is None:
+                index.pop(name, None)
+
+                for version in Speakers.converters:
+                    SpeakerStore.delete(version, [name])
+            else:
+                for version, se in ses.items():
+                    SpeakerStore.put(version, {name: se})
+
+                index[name] = entry
+
+            tmp_file = f'{Speakers.index_path()}.{os.getpid()}.tmp'
+
+            with open(tmp_file, 'w') as f:
+                json.dump(index, f, indent=2, sort_keys=True)
+
+            os.replace(tmp_file, Speakers.index_path())
+            return True
+
+    @staticmethod
+    def index_changed():
+
+        try:
+            mtime = os.stat(Speakers.index_path()).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        changed = mtime != Speakers.index_mtime
+        Speakers.index_mtime = mtime
+        return changed
+
+    @staticmethod
+    def load():
+
+        # Startup, the SEs of registered voices are only extracted again for a converter
+        # version that was not enabled when they were registered
+        Speakers.index_changed()
+
+        for name, entry in Speakers.read_index().items():
+            file = f"{Speakers.path}/{entry['file']}"
+
+            for version, converter in Speakers.converters.items():
+
+                if not SpeakerStore.has(version, name):
+                    se = Embedding.get_target_se(Speakers.logger, file, converter, Embedding.checkpoint_hashes.get(version, ''), Embedding.vad, f'{Embedding.cache_path}/{version}')
+                    SpeakerStore.put(version, {name: se})
+
+            Speakers.add(name, entry)
+
+        Speakers.logger.info(f" > Loaded {len(Speakers.registered)} registered voice(s) from {Speakers.path}")
+
+    @staticmethod
+    async def refresh():
+
+        # Voices registered or deleted by another worker are picked up on the next request
+        SpeakerStore.refresh()
+
+        if not Speakers.index_changed():
+            return
+
+        loop = asyncio.get_running_loop()
+        index = await loop.run_in_executor(None, Speakers.read_index)
+
+        for name in [name for name in Speakers.registered if name not in index]:
+            Speakers.remove(name)
+
+        for name, entry in index.items():
+
+            if Speakers.revision(name) == entry['revision'] or name in Speakers.pending:
+                continue
+
+            Speakers.pending.add(name)
+
+            try:
+                missing = [version for version in Speakers.converters if not SpeakerStore.has(version, name)]
+
+                for version, se in (await Speakers.extract(f"{Speakers.path}/{entry['file']}", missing)).items():
+                    await loop.run_in_executor(None, SpeakerStore.put, version, {name: se})
+
+                Speakers.add(name, entry)
+            except Exception as e:
+                Speakers.logger.error(f" > Could not load voice {name}: {e}")
+            finally:
+                Speakers.pending.discard(name)
+
+    @staticmethod
+    async def extract(file, versions=None):
+
+        # One target SE per converter version, computed in the inference pool
+        ses = {}
+
+        for version, converter in Speakers.converters.items():
+
+            if versions is not None and version not in versions:
+                continue
+
+            ses[version] = await Inference.run(
+                converter.device,
+                f'converter_{version}',
+                Embedding.get_target_se,
+                Speakers.logger,
+                file,
+                converter,
+                Embedding.checkpoint_hashes.get(version, ''),
+                Embedding.vad,
+                f'{Embedding.cache_path}/{version}',
+            )
+
+        return ses
+
+    @staticmethod
+    def add(name, entry):
+
+        # No await in between, requests see either none or all of the voice
+        Speakers.speakers.add(name)
+        Speakers.reference_speakers[name] = f"{Speakers.path}/{entry['file']}"
+        Speakers.registered[name] = entry
+
+    @staticmethod
+    def remove(name):
+
+        Speakers.speakers.discard(name)
+
+        Speakers.reference_speakers.pop(name, None)
+        Speakers.registered.pop(name, None)
+
+    @staticmethod
+    def write_reference(upload, file):
+
+        with open(file, 'wb') as f:
+            shutil.copyfileobj(upload.open(), f)
+
+    @staticmethod
+    def remove_file(file):
+
+        try:
+            os.remove(file)
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    async def register(name, upload):
+
+        if name in Speakers.pending or name in Speakers.reference_speakers:
+            return Response.payload(False, 409, f"Voice '{name}' already exists")
+
+        Speakers.pending.add(name)
+        loop = asyncio.get_running_loop()
+        entry = {'file': f'{name}_{uuid4().hex[:12]}.{upload.extension}', 'created': int(time.time())}
+        entry['revision'] = entry['file'].rsplit('.', 1)[0]
+        file = f"{Speakers.path}/{entry['file']}"
+
+        try:
+            await loop.run_in_executor(None, Speakers.write_reference, upload, file)
+            ses = await Speakers.extract(file)
+
+            if not await loop.run_in_executor(None, Speakers.update_index, name, entry, ses):
+                await loop.run_in_executor(None, Speakers.remove_file, file)
+                return Response.payload(False, 409, f"Voice '{name}' already exists")
+
+            Speakers.add(name, entry)
+        except BaseException:
+            await asyncio.shield(loop.run_in_executor(None, Speakers.remove_file, file))
+            raise
+        finally:
+            Speakers.pending.discard(name)
+
+        Speakers.logger.info(f" > Registered voice {name}")
+        return Response.payload(True, 201, f"Voice '{name}' registered", {'name': name, 'versions': list(ses), 'created': entry['created']})
+
+    @staticmethod
+    async def delete(name):
+
+        if name in Speakers.builtin:
+            return Response.payload(False, 400, f"Voice '{name}' is set in SPEAKERS and cannot be deleted")
+
+        entry = Speakers.registered.get(name)
+
+        if entry is None:
+            return Response.not_found(f"Voice '{name}' not found")
+
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, Speakers.update_index, name, None)
+        Speakers.remove(name)
+        await loop.run_in_executor(None, Speakers.remove_file, f"{Speakers.path}/{entry['file']}")
+        Speakers.logger.info(f" > Deleted voice {name}")
+        return Response.payload(True, 200, f"Voice '{name}' deleted", {'name': name})
@@ -0,0 +1,136 @@
+import os, re, asyncio
+from time import time, time_ns
+
+class Storage:
+
+    # Only files created by Voice.generate_random_filename are managed,
+    # AUDIO_FILES_PATH is often shared with other programs (/tmp)
+    filename_pattern = re.compile(r'^\d{8}_\d{6}_\d{3}(_[0-9a-f]{8})?\.(wav|mp3|opus|aac|flac|pcm)$')
+
+    @staticmethod
+    def set_vars(logger, path, max_bytes, ttl, interval):
+
+        Storage.logger = logger
+        Storage.path = path
+        Storage.max_bytes = max_bytes
+        Storage.ttl = ttl
+        Storage.interval = interval
+        Storage.task = None
+        Storage.usage = {'files': 0, 'bytes': 0}
+        Storage.counters = {'ttl_evictions': 0, 'size_evictions': 0, 'removed': 0}
+
+    @staticmethod
+    def stats():
+
+        return dict(Storage.usage, **Storage.counters)
+
+    @staticmethod
+    def is_managed(filename):
+
+        return Storage.filename_pattern.match(filename) is not None
+
+    @staticmethod
+    def touch(filename):
+
+        # Only the access time is bumped, the modification time is kept
+        # because it backs the Last-Modified and ETag headers of the file
+        try:
+            path = os.path.join(Storage.path, filename)
+            os.utime(path, ns=(time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    @staticmethod
+    def write(filename, data):
+
+        path = os.path.join(Storage.path, filename)
+
+        with open(path, 'wb') as f:
+            f.write(data)
+
+        return path
+
+    @staticmethod
+    async def save(filename, data):
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(None, Storage.write, filename, data)
+
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # The write can not be interrupted, remove the file once it is done since nobody will fetch it
+            future.add_done_callback(lambda f: Storage.remove(os.path.join(Storage.path, filename)))
+            raise
+
+    @staticmethod
+    def remove(file_path):
+
+        try:
+            os.remove(file_path)
+            Storage.counters['removed'] += 1
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def cleanup():
+
+        now = time()
+        files = []
+
+        for entry in os.scandir(Storage.path):
+
+            if not entry.is_file() or not Storage.is_managed(entry.name):
+                continue
+
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            last_access = max(stat.st_atime, stat.st_mtime)
+
+            if Storage.ttl > 0 and now - last_access > Storage.ttl:
+                Storage.remove(entry.path)
+                Storage.counters['ttl_evictions'] += 1
+                continue
+
+            files.append((last_access, stat.st_size, entry.path))
+
+        files.sort()
+        total = sum(size for last_access, size, path in files)
+
+        while Storage.max_bytes > 0 and total > Storage.max_bytes and files:
+            last_access, size, path = files.pop(0)
+            Storage.remove(path)
+            Storage.counters['size_evictions'] += 1
+            total -= size
+
+        Storage.usage = {'files': len(files), 'bytes': total}
+
+    @staticmethod
+    async def run():
+
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                await loop.run_in_executor(None, Storage.cleanup)
+                Storage.logger.debug(f" > Audio files cleanup done: {Storage.stats()}")
+            except Exception as e:
+                Storage.logger.error(f" > Audio files cleanup failed: {str(e)}")
+
+            await asyncio.sleep(Storage.interval)
+
+    @staticmethod
+    def start():
+
+        if Storage.task is None and (Storage.ttl > 0 or Storage.max_bytes > 0):
+            Storage.task = asyncio.ensure_future(Storage.run())
+
+    @staticmethod
+    def stop():
+
+        if Storage.task is not None:
+            Storage.task.cancel()
+            Storage.task = None
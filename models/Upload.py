@@ -0,0 +1,80 @@
+import io, hashlib, tempfile
+
+class Upload:
+
+    chunk_size = 64 * 1024
+    header_size = 2048
+
+    def __init__(self, file=None, spool_size=1024 * 1024):
+
+        # Uploaded audio kept in memory up to spool_size bytes and in a temporary file past that,
+        # the hash and leading bytes are tracked as the data is written
+        self.file = file if file is not None else tempfile.SpooledTemporaryFile(max_size=spool_size)
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.header = b''
+        self.extension = None
+
+    @property
+    def digest(self):
+
+        return self.sha.hexdigest()
+
+    def track(self, chunk):
+
+        if len(self.header) < Upload.header_size:
+            self.header += chunk[:Upload.header_size - len(self.header)]
+
+        self.sha.update(chunk)
+        self.size += len(chunk)
+
+    def write(self, chunk):
+
+        self.track(chunk)
+        self.file.write(chunk)
+
+    def open(self):
+
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+
+        self.file.close()
+
+    @staticmethod
+    def from_bytes(data):
+
+        upload = Upload(io.BytesIO())
+        upload.write(data)
+        return upload
+
+    @staticmethod
+    def from_file(file):
+
+        # Wraps an already spooled file, such as a multipart part, reading it once for the hash
+        upload = Upload(file)
+        file.seek(0)
+        chunk = file.read(Upload.chunk_size)
+
+        while chunk:
+            upload.track(chunk)
+            chunk = file.read(Upload.chunk_size)
+
+        return upload
+
+    @staticmethod
+    async def from_stream(chunks, max_size, spool_size):
+
+        # Returns None as soon as the body goes over max_size
+        upload = Upload(spool_size=spool_size)
+
+        async for chunk in chunks:
+
+            if upload.size + len(chunk) > max_size:
+                upload.close()
+                return None
+
+            upload.write(chunk)
+
+        return upload
@@ -1,22 +1,33 @@
-import torch
+import torch, uuid, re, asyncio, functools
+import numpy as np
 from datetime import datetime
+from openvoice.mel_processing import spectrogram_torch
+from melo import utils as melo_utils
+from models.Inference import Inference
+from models.Batcher import Batcher
+from models.Registry import Registry
+from models.Embedding import Embedding
+from models.Audio import Audio
+from models.Compiler import Compiler
+from models.Metrics import Metrics
 
 class Voice:
 
     @staticmethod
-    def set_vars(logger, language_names, speaker_ids, openvoice_path, models, ckpt_base, base_speaker, watermark):
+    def set_vars(logger, language_names, speaker_ids, openvoice_path, ckpt_base, watermark, window=0, overlap=0.5, parallel_windows=1):
         
         Voice.logger = logger
         Voice.language_names = language_names
         Voice.speaker_ids = speaker_ids
         Voice.openvoice_path = openvoice_path
-        Voice.models = models
         Voice.ckpt_base = ckpt_base
-        Voice.base_speaker = base_speaker
         Voice.watermark = watermark
+        Voice.window = window
+        Voice.overlap = min(overlap, window / 2)
+        Voice.parallel_windows = max(1, parallel_windows)
 
     @staticmethod
-    async def tts_v1(args, output_file, device):
+    async def tts_v1(args, device):
 
         speaker = args.get('voice').lower()
         style = args.get('style').lower()
@@ -24,14 +35,25 @@ class Voice:
         language = raw_lang.upper()
         text = args['input']
         speed = float(args['speed'])
-        Voice.logger.debug(f' > Loading speaker v1 model for {language}...')
-        source_se = torch.load(f'{Voice.ckpt_base[language]}/{raw_lang}_default_se.pth').to(device)
+        with Metrics.stage('source_se'):
+            source_se = Embedding.get_source_se('v1', language)
+
         Voice.logger.debug(f' > Converting text to audio...')
-        Voice.base_speaker[language].tts(text, output_file, speaker=style, language=Voice.language_names[language], speed=speed)
-        return source_se
+
+        with Metrics.stage('model_load'):
+            tts = await Registry.acquire('v1', language)
+
+        with Metrics.stage('tts'):
+            if Batcher.enabled():
+                item = (text, style, Voice.language_names[language], speed)
+                audio = await Batcher.submit(('tts_v1', language, speed), device, f'tts_v1:{language}', functools.partial(Voice.tts_v1_batch, tts), item)
+            else:
+                audio = await Inference.run(device, f'tts_v1:{language}', tts.tts, text, None, speaker=style, language=Voice.language_names[language], speed=speed)
+
+        return audio, tts.hps.data.sampling_rate, source_se
     
     @staticmethod
-    async def tts_v2(args, output_file, device):
+    async def tts_v2(args, device):
     
         raw_lang = args.get('model')
         language = raw_lang.upper()
@@ -49,32 +71,268 @@ class Voice:
             
         final_speaker_key = speaker_key.replace('_', '-')
         speaker_id = Voice.speaker_ids[language][format_speaker_key]
-        Voice.logger.debug(f' > Loading speaker v2 model for {final_speaker_key}...')
-        source_se = torch.load(f'{Voice.openvoice_path}/checkpoints_v2/base_speakers/ses/{final_speaker_key}.pth', map_location=device)
+        with Metrics.stage('source_se'):
+            source_se = Embedding.get_source_se('v2', language, final_speaker_key)
+
         Voice.logger.debug(f' > Converting text to audio...')
-        Voice.models[language].tts_to_file(text, speaker_id, output_file, speed=speed)
-        return source_se
+
+        with Metrics.stage('model_load'):
+            tts = await Registry.acquire('v2', language)
+
+        with Metrics.stage('tts'):
+            if Batcher.enabled():
+                item = (text, speaker_id, speed)
+                audio = await Batcher.submit(('tts_v2', language, speed), device, f'tts_v2:{language}', functools.partial(Voice.tts_v2_batch, tts), item)
+            else:
+                audio = await Inference.run(device, f'tts_v2:{language}', tts.tts_to_file, text, speaker_id, None, speed=speed)
+
+        return audio, tts.hps.data.sampling_rate, source_se
 
     #@staticmethod
-    async def convert(src_file, output_file, src_se, tgt_se, converter):
+    def tts_v1_batch(tts, items):
+
+        # Batched version of BaseSpeakerTTS.tts, every sentence of every item is padded
+        # into a single forward pass, items share the same language and speed
+        pieces = []
+        speed = items[0][3]
+
+        for index, (text, style, language_name, item_speed) in enumerate(items):
+            mark = tts.language_marks.get(language_name.lower())
+
+            for t in tts.split_sentences_into_pieces(text, mark):
+                t = re.sub(r'([a-z])([A-Z])', r'\1 \2', t)
+                t = f'[{mark}]{t}[{mark}]'
+                pieces.append((index, tts.get_text(t, tts.hps, False), tts.hps.speakers[style]))
+
+        lengths = [phones.size(0) for index, phones, speaker_id in pieces]
+        x = torch.zeros(len(pieces), max(lengths), dtype=torch.long)
+
+        for i, (index, phones, speaker_id) in enumerate(pieces):
+            x[i, :lengths[i]] = phones
+
+        with torch.no_grad():
+            x = x.to(tts.device)
+            x_lengths = torch.LongTensor(lengths).to(tts.device)
+            sid = torch.LongTensor([speaker_id for index, phones, speaker_id in pieces]).to(tts.device)
+            o, attn, y_mask, _ = tts.model.infer(x, x_lengths, sid=sid, noise_scale=0.667, noise_scale_w=0.6, length_scale=1.0 / speed)
+
+        return Voice.split_batch(tts, o, y_mask, [index for index, phones, speaker_id in pieces], len(items), speed)
+
+    #@staticmethod
+    def tts_v2_batch(tts, items):
+
+        # Batched version of melo TTS.tts_to_file, items share the same language and speed
+        pieces = []
+        speed = items[0][2]
+
+        for index, (text, speaker_id, item_speed) in enumerate(items):
+
+            for t in tts.split_sentences_into_pieces(text, tts.language, quiet=True):
+
+                if tts.language in ['EN', 'ZH_MIX_EN']:
+                    t = re.sub(r'([a-z])([A-Z])', r'\1 \2', t)
+
+                bert, ja_bert, phones, tones, lang_ids = melo_utils.get_text_for_tts_infer(t, tts.language, tts.hps, tts.device, tts.symbol_to_id)
+                pieces.append((index, speaker_id, phones, tones, lang_ids, bert, ja_bert))
+
+        lengths = [piece[2].size(0) for piece in pieces]
+        count, max_length = len(pieces), max(lengths)
+        x = torch.zeros(count, max_length, dtype=torch.long, device=tts.device)
+        tones = torch.zeros(count, max_length, dtype=torch.long, device=tts.device)
+        lang_ids = torch.zeros(count, max_length, dtype=torch.long, device=tts.device)
+        bert = torch.zeros(count, pieces[0][5].size(0), max_length, device=tts.device)
+        ja_bert = torch.zeros(count, pieces[0][6].size(0), max_length, device=tts.device)
+
+        for i, (index, speaker_id, piece_phones, piece_tones, piece_lang_ids, piece_bert, piece_ja_bert) in enumerate(pieces):
+            x[i, :lengths[i]] = piece_phones
+            tones[i, :lengths[i]] = piece_tones
+            lang_ids[i, :lengths[i]] = piece_lang_ids
+            bert[i, :, :lengths[i]] = piece_bert
+            ja_bert[i, :, :lengths[i]] = piece_ja_bert
+
+        with torch.no_grad():
+            x_lengths = torch.LongTensor(lengths).to(tts.device)
+            speakers = torch.LongTensor([piece[1] for piece in pieces]).to(tts.device)
+            o, attn, y_mask, _ = tts.model.infer(x, x_lengths, speakers, tones, lang_ids, bert, ja_bert, sdp_ratio=0.2, noise_scale=0.6, noise_scale_w=0.8, length_scale=1. / speed)
+
+        return Voice.split_batch(tts, o, y_mask, [piece[0] for piece in pieces], len(items), speed)
+
+    #@staticmethod
+    def split_batch(tts, o, y_mask, owners, count, speed):
+
+        # Trims the padding off every sentence and joins the sentences of each item back together
+        frame_lengths = y_mask.sum(dim=(1, 2)).long().tolist()
+        audio_lists = [[] for i in range(count)]
+
+        for i, owner in enumerate(owners):
+            audio_lists[owner].append(o[i, 0, :frame_lengths[i] * tts.hps.data.hop_length].data.cpu().float().numpy())
+
+        return [tts.audio_numpy_concat(audio_list, sr=tts.hps.data.sampling_rate, speed=speed) for audio_list in audio_lists]
+
+    #@staticmethod
+    async def convert(audio, sampling_rate, src_se, tgt_se, converter, version):
+
+        if Voice.windowed(audio, sampling_rate):
+            chunks = [chunk async for chunk in Voice.convert_windows(audio, sampling_rate, src_se, tgt_se, converter, version)]
+            return np.concatenate(chunks), converter.hps.data.sampling_rate
+
+        with Metrics.stage('conversion'):
+            return await Voice.run_convert(audio, sampling_rate, src_se, tgt_se, converter, version)
+
+    #@staticmethod
+    def windowed(audio, sampling_rate):
+
+        return Voice.window > 0 and len(audio) > (Voice.window + Voice.overlap) * sampling_rate
+
+    #@staticmethod
+    async def convert_windows(audio, sampling_rate, src_se, tgt_se, converter, version):
+
+        # Long audio is converted in overlapping windows, so the spectrogram and the forward pass
+        # never cover more than one window. Up to parallel_windows windows run at once and the
+        # chunks are yielded in order as soon as their join with the next window is crossfaded
+        target_rate = converter.hps.data.sampling_rate
+
+        with Metrics.stage('decode'):
+            audio = await Inference.run(converter.device, 'audio', Audio.resample, audio, sampling_rate, target_rate)
+
+        window = int(Voice.window * target_rate)
+        hop = window - int(Voice.overlap * target_rate)
+        starts = list(range(0, max(1, len(audio) - window + hop), hop))
+
+        # The last window runs to the end of the audio. Without overlap it can be a few samples
+        # long, too short for the padding of the spectrogram, then it joins the one before it
+        if len(starts) > 1 and len(audio) - starts[-1] < converter.hps.data.filter_length:
+            starts.pop()
+
+        end = starts[-1]
+        pending = []
+        tail = None
+
+        def schedule():
+            start = starts.pop(0)
+            chunk = audio[start:] if start == end else audio[start:start + window]
+            return asyncio.ensure_future(Voice.run_convert(chunk, target_rate, src_se, tgt_se, converter, version))
+
+        try:
+            while starts or pending:
+
+                while starts and len(pending) < Voice.parallel_windows:
+                    pending.append(schedule())
+
+                with Metrics.stage('conversion'):
+                    converted, rate = await pending.pop(0)
 
-        converter.convert(
-            audio_src_path=src_file, 
+                last = not starts and not pending
+                head = converted if tail is None else Audio.crossfade(tail, converted)
+                # The converted window can be a few samples shorter than its input (no spectrogram centering)
+                split = len(head) if last else min(hop, len(converted))
+                tail = converted[split:]
+                yield head[:split]
+
+        finally:
+            for task in pending:
+                task.cancel()
+
+    #@staticmethod
+    async def run_convert(audio, sampling_rate, src_se, tgt_se, converter, version):
+
+        if Batcher.enabled():
+            item = (audio, sampling_rate, src_se, tgt_se)
+            audio = await Batcher.submit(('converter', version), converter.device, f'converter_{version}', functools.partial(Voice.convert_batch, converter), item)
+            return audio, converter.hps.data.sampling_rate
+
+        audio = await Inference.run(
+            converter.device,
+            f'converter_{version}',
+            Voice.convert_audio,
+            converter,
+            audio,
+            sampling_rate,
             src_se=src_se, 
-            tgt_se=tgt_se, 
-            output_path=output_file,
-            message=Voice.watermark
+            tgt_se=tgt_se
         )
-        return True
-    
+        return audio, converter.hps.data.sampling_rate
+
+    #@staticmethod
+    def convert_audio(converter, audio, sampling_rate, src_se, tgt_se, tau=0.3):
+
+        # Same steps as ToneColorConverter.convert, but on in-memory audio instead of a file path
+        hps = converter.hps
+        audio = Audio.resample(audio, sampling_rate, hps.data.sampling_rate)
+
+        with torch.no_grad():
+            y = torch.FloatTensor(audio).to(converter.device).unsqueeze(0)
+            spec = spectrogram_torch(y, hps.data.filter_length, hps.data.sampling_rate, hps.data.hop_length, hps.data.win_length, center=False).to(converter.device)
+            spec_lengths = torch.LongTensor([spec.size(-1)]).to(converter.device)
+            audio = Compiler.voice_conversion(converter, spec, spec_lengths, src_se, tgt_se, tau)[0, 0].data.cpu().float().numpy()
+
+        return converter.add_watermark(audio, Voice.watermark)
+
+    #@staticmethod
+    def convert_batch(converter, items, tau=0.3):
+
+        # Batched version of convert_audio, spectrograms are zero padded to the longest item
+        hps = converter.hps
+        specs = []
+
+        with torch.no_grad():
+
+            for audio, sampling_rate, src_se, tgt_se in items:
+                audio = Audio.resample(audio, sampling_rate, hps.data.sampling_rate)
+                y = torch.FloatTensor(audio).to(converter.device).unsqueeze(0)
+                specs.append(spectrogram_torch(y, hps.data.filter_length, hps.data.sampling_rate, hps.data.hop_length, hps.data.win_length, center=False)[0])
+
+            lengths = [spec.size(-1) for spec in specs]
+            spec = torch.zeros(len(specs), specs[0].size(0), max(lengths), device=converter.device)
+
+            for i, item_spec in enumerate(specs):
+                spec[i, :, :lengths[i]] = item_spec
+
+            spec_lengths = torch.LongTensor(lengths).to(converter.device)
+            sid_src = torch.cat([src_se for audio, sampling_rate, src_se, tgt_se in items], 0)
+            sid_tgt = torch.cat([tgt_se for audio, sampling_rate, src_se, tgt_se in items], 0)
+            o = Compiler.voice_conversion(converter, spec, spec_lengths, sid_src, sid_tgt, tau)
+
+        outputs = []
+
+        for i in range(len(items)):
+            audio = o[i, 0, :lengths[i] * hps.data.hop_length].data.cpu().float().numpy()
+            outputs.append(converter.add_watermark(audio, Voice.watermark))
+
+        return outputs
+
+    #@staticmethod
+    async def load_audio(upload, converter):
+
+        with Metrics.stage('decode'):
+            audio = await Inference.run(converter.device, 'audio', Audio.load, upload.open(), converter.hps.data.sampling_rate)
+
+        return audio, converter.hps.data.sampling_rate
+
+    #@staticmethod
+    async def split_text(version, args):
+
+        raw_lang = args.get('model')
+        language = raw_lang.upper()
+        text = args.get('input')
+
+        if version == 'v1':
+            tts = await Registry.acquire('v1', language)
+            mark = tts.language_marks.get(Voice.language_names[language].lower())
+            return tts.split_sentences_into_pieces(text, mark)
+
+        tts = await Registry.acquire('v2', language)
+        return tts.split_sentences_into_pieces(text, tts.language, quiet=True)
+
     #@staticmethod
     async def build_source_se(args, version, device):
 
         if version == 'v1':
             raw_lang = args.get('model')
             language = raw_lang.upper()
-            Voice.logger.debug(f' > Loading speaker v1 model for {language}...')
-            return torch.load(f'{Voice.ckpt_base[language]}/{raw_lang}_default_se.pth').to(device)
+
+            with Metrics.stage('source_se'):
+                return Embedding.get_source_se('v1', language)
         
         elif version == 'v2':
             raw_lang = args.get('model')
@@ -82,12 +340,51 @@ class Voice:
             default_speaker_key = list(Voice.speaker_ids[language].keys())[-1].lower()
             speaker_key = args.get('accent', default_speaker_key).lower()
             final_speaker_key = speaker_key.replace('_', '-')
-            Voice.logger.debug(f' > Loading speaker v2 model for {final_speaker_key}...')
-            return torch.load(f'{Voice.openvoice_path}/checkpoints_v2/base_speakers/ses/{final_speaker_key}.pth', map_location= device)
+
+            with Metrics.stage('source_se'):
+                return Embedding.get_source_se('v2', language, final_speaker_key)
+
+    #@staticmethod
+    async def build_upload_se(args, upload, converter, version, device):
+
+        # The SE of the uploaded clip itself, cached by its content hash so retries and
+        # conversions of the same clip to other voices skip the extraction
+        key = Embedding.upload_se_key(upload.digest, version)
+        se = Embedding.lookup_upload_se(key)
+
+        if se is not None:
+            return se
+
+        task = Embedding.inflight.get(key)
+        leader = task is None
+
+        if leader:
+            task = asyncio.ensure_future(Inference.run(converter.device, f'converter_{version}', Embedding.extract_upload_se, key, upload, converter, version))
+            task.add_done_callback(lambda done: Embedding.inflight.pop(key, None))
+            Embedding.inflight[key] = task
+
+        try:
+            with Metrics.stage('source_se'):
+                se = await (task if leader else asyncio.shield(task))
+        except NotImplementedError:
+            # se_extractor found no speech segment long enough, use the base speaker SE
+            Voice.logger.warning(' > No speech segments found in the uploaded audio, using the base speaker SE')
+            return await Voice.build_source_se(args, version, device)
+        except asyncio.CancelledError:
+            # The first request was cancelled, take over unless this one was too
+            if leader or not task.cancelled():
+                raise
+
+            return await Voice.build_upload_se(args, upload, converter, version, device)
+
+        if leader:
+            Embedding.store_upload_se(key, se)
+
+        return se
 
     #@staticmethod
     def generate_random_filename(prefix='', ext='wav'):
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
-        random_filename = f"{prefix}{timestamp}.{ext}"
+        random_filename = f"{prefix}{timestamp}_{uuid.uuid4().hex[:8]}.{ext}"
         return random_filename
 
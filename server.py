@@ -0,0 +1,167 @@
+import os, sys, gc, signal, socket, time
+import torch, uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+SERVER_ADDRESS = os.getenv("SERVER_ADDRESS", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 5000))
+WORKERS = int(os.getenv("SERVER_WORKERS", 1))
+# Empty splits the cores evenly between the workers
+TORCH_THREADS_PER_WORKER = int(
+    os.getenv("TORCH_THREADS_PER_WORKER") or max(1, (os.cpu_count() or 1) // WORKERS)
+)
+GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", 30))
+
+# OpenMP thread pools do not survive fork, so the master runs single threaded
+# and every worker sets its own thread count after forking
+torch.set_num_threads(1)
+
+# Importing the app runs initialize_globals once, in the master process
+from app import app, logger, DEVICE_V1, DEVICE_V2
+
+workers = set()
+stopping = False
+reloading = False
+
+
+def create_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((SERVER_ADDRESS, SERVER_PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock):
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    config = uvicorn.Config(
+        app,
+        log_level=LOG_LEVEL.lower(),
+        lifespan="on",
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn_worker(sock):
+    pid = os.fork()
+
+    if pid == 0:
+        for signum in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+
+        exit_code = 0
+
+        try:
+            run_worker(sock)
+        except Exception as e:
+            logger.error(f" > Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+
+        os._exit(exit_code)
+
+    logger.info(f" > Started worker {pid} with {TORCH_THREADS_PER_WORKER} torch thread(s)")
+    return pid
+
+
+def handle_stop(signum, frame):
+    global stopping
+    stopping = True
+
+
+def handle_reload(signum, frame):
+    global reloading
+    reloading = True
+
+
+def stop_workers(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+
+
+def reap_workers(sock):
+    while True:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+
+        if pid == 0:
+            return
+
+        if pid in workers:
+            workers.discard(pid)
+
+            if not stopping:
+                logger.warning(f" > Worker {pid} exited with status {status}, restarting")
+                workers.add(spawn_worker(sock))
+
+
+def main():
+    global reloading
+
+    if WORKERS > 1 and (DEVICE_V1.startswith("cuda") or DEVICE_V2.startswith("cuda")):
+        # A CUDA context cannot be shared with forked processes
+        logger.warning(" > CUDA devices cannot be shared across forked workers, using 1 worker")
+        torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+        uvicorn.run(app, host=SERVER_ADDRESS, port=SERVER_PORT, log_level=LOG_LEVEL.lower())
+        return
+
+    sock = create_socket()
+    logger.info(f" > Listening on {SERVER_ADDRESS}:{SERVER_PORT} with {WORKERS} worker(s)")
+
+    # Move everything loaded so far out of the garbage collector's reach, so collections
+    # in the workers do not write to (and unshare) the pages holding the models
+    gc.collect()
+    gc.freeze()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    signal.signal(signal.SIGHUP, handle_reload)
+
+    for i in range(WORKERS):
+        workers.add(spawn_worker(sock))
+
+    while not stopping:
+
+        if reloading:
+            # Start the new generation first, then let the old one finish in-flight requests
+            reloading = False
+            logger.info(" > Reloading workers")
+            old_workers = set(workers)
+            workers.clear()
+
+            for i in range(WORKERS):
+                workers.add(spawn_worker(sock))
+
+            stop_workers(old_workers)
+
+        reap_workers(sock)
+        time.sleep(0.5)
+
+    logger.info(" > Stopping workers")
+    stop_workers(workers)
+    deadline = time.time() + GRACEFUL_TIMEOUT
+
+    while workers and time.time() < deadline:
+        reap_workers(sock)
+        time.sleep(0.2)
+
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    sock.close()
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Imports the app with the stub models from benchmarks/stubs.py, so the tests that use it run on
+any cpu-only machine without checkpoints. A test file may set environment variables before
+importing it, they take precedence over the ones set here.
+"""
+import os, sys, atexit, shutil, tempfile
+
+TESTS_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.abspath(os.path.join(TESTS_DIRECTORY, '../')))
+sys.path.insert(0, os.path.abspath(os.path.join(TESTS_DIRECTORY, '../benchmarks')))
+
+import stubs
+
+WORK_PATH = tempfile.mkdtemp(prefix='openvoice-test-')
+atexit.register(shutil.rmtree, WORK_PATH, True)
+stubs.create_checkpoints(f'{WORK_PATH}/OpenVoice', ['EN'], ['EN'])
+
+for name, value in {
+    'LOG_LEVEL': 'WARNING',
+    'OPENVOICE_PATH': f'{WORK_PATH}/OpenVoice',
+    'AUDIO_FILES_PATH': f'{WORK_PATH}/audio',
+    'MODEL_LANGUAGES_V1': 'EN:English',
+    'MODEL_LANGUAGES_V2': 'EN',
+    'SPEAKERS_FOLDER': 'speakers',
+    'SPEAKERS': 'elon',
+    'DEVICE_V1': 'cpu',
+    'DEVICE_V2': 'cpu',
+    'WARMUP': 'false',
+    'SE_CACHE_PATH': f'{WORK_PATH}/cache/se',
+    'CONVERTER_CACHE_PATH': f'{WORK_PATH}/cache/converter',
+    'RESULT_CACHE_PATH': f'{WORK_PATH}/cache/results',
+    'RESULT_CACHE_MEMORY_MB': '0',
+    'RESULT_CACHE_DISK_MB': '0',
+    'PROFILE_PATH': f'{WORK_PATH}/cache/profiles',
+    'VOICES_PATH': f'{WORK_PATH}/voices',
+    'SPEAKER_STORE_PATH': f'{WORK_PATH}/cache/speakers',
+}.items():
+    os.environ.setdefault(name, value)
+
+os.makedirs(os.environ['AUDIO_FILES_PATH'], exist_ok=True)
+stubs.install()
+
+from app import app
+from models.Inference import Inference
+from models.Admission import Admission
+
+
+def reset_locks():
+
+    # Each test runs in its own event loop and an asyncio semaphore binds to the first loop
+    # that waits on it, call this before a test where requests wait on each other
+    Inference.semaphores.clear()
+    Admission.states.clear()
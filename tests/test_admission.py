@@ -0,0 +1,84 @@
+import os, sys, asyncio, logging
+from unittest import IsolatedAsyncioTestCase
+
+os.environ['ADMISSION_MAX_CONCURRENCY'] = os.getenv("ADMISSION_MAX_CONCURRENCY", '1')
+os.environ['ADMISSION_MAX_QUEUE'] = os.getenv("ADMISSION_MAX_QUEUE", '0')
+os.environ['RESULT_CACHE_MEMORY_MB'] = os.getenv("RESULT_CACHE_MEMORY_MB", '16')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app, stubs
+from models.Admission import Admission
+
+class TestAdmission(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.limits = Admission.limits, Admission.queue_limits, Admission.queue_timeout, Admission.states
+        Admission.set_vars(logging.getLogger(__name__), {'default': 1}, {'default': 1}, 0.1)
+
+    async def asyncTearDown(self):
+        Admission.limits, Admission.queue_limits, Admission.queue_timeout, Admission.states = self.limits
+
+    async def test_queue_full(self):
+        self.assertIsNone(await Admission.acquire('v2:EN'))
+        waiting = asyncio.create_task(Admission.acquire('v2:EN', 5))
+        await asyncio.sleep(0)
+        rejection = await Admission.acquire('v2:EN')
+        self.assertEqual(rejection['code'], 429)
+        self.assertGreaterEqual(rejection['result']['data']['retry_after'], 1)
+        Admission.release('v2:EN')
+        self.assertIsNone(await waiting)
+        Admission.release('v2:EN')
+        self.assertEqual(Admission.stats()['v2:EN']['rejected'], 1)
+
+    async def test_queue_timeout(self):
+        self.assertIsNone(await Admission.acquire('v2:EN'))
+        rejection = await Admission.acquire('v2:EN', 5)
+        self.assertEqual(rejection['code'], 503)
+        self.assertGreaterEqual(rejection['result']['data']['retry_after'], 1)
+        self.assertEqual(Admission.stats()['v2:EN']['timeouts'], 1)
+        Admission.release('v2:EN')
+
+    async def test_deadline_before_queue_timeout(self):
+        self.assertIsNone(await Admission.acquire('v2:EN'))
+        with self.assertRaises(asyncio.TimeoutError):
+            await Admission.acquire('v2:EN', 0.05)
+        Admission.release('v2:EN')
+
+    async def test_limits_per_model(self):
+        self.assertIsNone(await Admission.acquire('v2:EN'))
+        self.assertIsNone(await Admission.acquire('v1:EN'))
+        Admission.release('v2:EN')
+        Admission.release('v1:EN')
+
+class TestEndpoint(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.rtf = stubs.RTF
+        self.payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel.',
+            'voice': 'elon',
+            'response_format': 'bytes',
+        }
+
+    async def asyncTearDown(self):
+        stubs.RTF = self.rtf
+
+    async def test_cache_hit_skips_admission(self):
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            cached = dict(self.payload, input='This one is in the cache.')
+            response = await c.post('/v2/generate-audio', json=cached)
+            self.assertEqual(response.status_code, 200)
+            # The only slot is taken by a slow request, and there is no queue
+            stubs.RTF = 1.0
+            busy = asyncio.create_task(c.post('/v2/generate-audio', json=self.payload))
+            await asyncio.sleep(0.2)
+            response = await c.post('/v2/generate-audio', json=cached)
+            self.assertEqual(response.status_code, 200)
+            response = await c.post('/v2/generate-audio', json=dict(self.payload, input='This one is not.'))
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response.headers)
+            response = await busy
+            self.assertEqual(response.status_code, 200)
@@ -85,6 +85,32 @@ class Test(IsolatedAsyncioTestCase):
             self.assertTrue(os.path.exists(out_file), f"File {out_file} does not exist.")
             #print(f'Audio file saved as {out_file}')
 
+    async def test_raw_upload_response(self):
+        out_file = 'outputs/test_change_voice_raw_upload_response.wav'
+        if os.path.exists(out_file):
+            os.remove(out_file)
+        payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel, we might just have a deal.',
+            'response_format': 'bytes'
+        }
+        async with self.client as c:
+            response = await c.post('/v2/generate-audio', json=payload)
+            self.assertEqual(response.status_code, 200)
+            audio_bytes = await response.get_data()
+        query = {
+            'model': 'en',
+            'response_format': 'bytes',
+            'voice': 'elon'
+        }
+        async with self.client as c:
+            response = await c.post(self.url_v2, data=audio_bytes, query_string=query, headers={'Content-Type': 'audio/wav'})
+            self.assertEqual(response.status_code, 200)
+            response_data = await response.get_data()
+            with open(out_file, 'wb') as audio_file:
+                audio_file.write(response_data)
+            self.assertTrue(os.path.exists(out_file), f"File {out_file} does not exist.")
+
     async def test_params_errors(self):
         # audio_data required param error
         payload = {
@@ -0,0 +1,57 @@
+import os, sys, io, base64
+from unittest import IsolatedAsyncioTestCase, mock
+import soundfile
+
+os.environ['CONVERSION_WINDOW'] = os.getenv("CONVERSION_WINDOW", '1')
+os.environ['CONVERSION_OVERLAP'] = os.getenv("CONVERSION_OVERLAP", '0')
+os.environ['RESULT_CACHE_MEMORY_MB'] = os.getenv("RESULT_CACHE_MEMORY_MB", '16')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app, stubs, reset_locks
+from models.Voice import Voice
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        reset_locks()
+
+    def audio_data(self, samples):
+        buffer = io.BytesIO()
+        soundfile.write(buffer, stubs.sine(samples), stubs.SAMPLING_RATE, format='WAV', subtype='PCM_16')
+        return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+    async def test_short_last_window(self):
+        # Two windows and 100 samples, the 100 samples are converted with the second window
+        payload = {
+            'model': 'en',
+            'voice': 'elon',
+            'audio_data': self.audio_data(2 * stubs.SAMPLING_RATE + 100),
+            'response_format': 'bytes',
+        }
+        with mock.patch.object(Voice, 'run_convert', wraps=Voice.run_convert) as run_convert:
+            async with app.test_app() as test_app:
+                c = test_app.test_client()
+                response = await c.post('/v2/change-voice', json=payload)
+                self.assertEqual(response.status_code, 200)
+        lengths = [len(call.args[0]) for call in run_convert.call_args_list]
+        self.assertEqual(lengths, [stubs.SAMPLING_RATE, stubs.SAMPLING_RATE + 100])
+
+    async def test_cached_stream_skips_decoding(self):
+        payload = {
+            'model': 'en',
+            'voice': 'elon',
+            'audio_data': self.audio_data(3 * stubs.SAMPLING_RATE),
+            'response_format': 'stream',
+        }
+        app_module = sys.modules['app']
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/change-voice', json=payload)
+            self.assertEqual(response.status_code, 200)
+            first = await response.get_data()
+            with mock.patch.object(app_module, 'load_source', wraps=app_module.load_source) as load_source:
+                response = await c.post('/v2/change-voice', json=payload)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(await response.get_data()), len(first))
+                load_source.assert_not_called()
@@ -0,0 +1,34 @@
+import os, sys
+from unittest import IsolatedAsyncioTestCase
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app, stubs
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.rtf = stubs.RTF
+        self.payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel.',
+            'voice': 'elon',
+            'response_format': 'bytes',
+        }
+
+    async def asyncTearDown(self):
+        stubs.RTF = self.rtf
+
+    async def test_deadline_exceeded(self):
+        # About 1.5s of speech takes 3s with the slower stub
+        stubs.RTF = 2.0
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/generate-audio', json=self.payload, headers={'X-Request-Timeout': '0.5'})
+            self.assertEqual(response.status_code, 504)
+
+    async def test_deadline_met(self):
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/generate-audio', json=self.payload, headers={'X-Request-Timeout': '30'})
+            self.assertEqual(response.status_code, 200)
@@ -333,6 +333,27 @@ class TestV2(IsolatedAsyncioTestCase):
             self.assertTrue(os.path.exists(out_file), f"File {out_file} does not exist.")
             #print(f' > Audio file saved as {out_file}')
 
+    async def test_audio_format_param(self):
+        for audio_format in ['mp3', 'opus', 'aac', 'flac', 'pcm']:
+            out_file = f'outputs/test_audio_format_param_v2.{audio_format}'
+            if os.path.exists(out_file):
+                os.remove(out_file)
+            payload = {
+                'model': 'en',
+                'input': 'Let me know how you feel, we might just have a deal.',
+                'voice': 'elon',
+                'response_format': 'bytes',
+                'audio_format': audio_format
+            }
+            async with self.client as c:
+                response = await c.post(self.url, json=payload)
+                self.assertEqual(response.status_code, 200)
+                response_data = await response.get_data()
+                self.assertTrue(len(response_data) > 0)
+                with open(out_file, 'wb') as audio_file:
+                    audio_file.write(response_data)
+                self.assertTrue(os.path.exists(out_file), f"File {out_file} does not exist.")
+
     async def test_base64_response(self):
         out_file = 'outputs/test_base64_response_v2.wav'
         if os.path.exists(out_file):
@@ -543,3 +564,12 @@ class TestV2(IsolatedAsyncioTestCase):
         async with self.client as c:
             response = await c.post(self.url, json=payload)
             self.assertEqual(response.status_code, 400)
+        # Wrong audio_format value error
+        payload = {
+            'model': 'en',
+            'audio_format': 'invalid_value',
+            'input': 'Let me know how you feel, we might just have a deal.'
+        }
+        async with self.client as c:
+            response = await c.post(self.url, json=payload)
+            self.assertEqual(response.status_code, 400)
@@ -41,6 +41,20 @@ class Test(IsolatedAsyncioTestCase):
             response = await c.post('/v1/audio/speech', json=payload)
             self.assertEqual(response.status_code, 200)
 
+    async def test_compressed_response(self):
+        for response_format in ['mp3', 'opus', 'aac', 'flac', 'pcm']:
+            payload = {
+                'model': 'en',
+                'input': 'Let me know how you feel, we might just have a deal.',
+                'voice': 'elon',
+                'response_format': response_format
+            }
+            async with self.client as c:
+                response = await c.post('/v2/audio/speech', json=payload)
+                self.assertEqual(response.status_code, 200)
+                response_data = await response.get_data()
+                self.assertTrue(len(response_data) > 0)
+
     async def test_params_errors(self):
         # Wrong response_format value error
         payload = {
@@ -0,0 +1,44 @@
+import os, sys
+from unittest import IsolatedAsyncioTestCase
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app
+from models.Metrics import Metrics
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def test_server_timing(self):
+        payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel, we might just have a deal.',
+            'voice': 'elon',
+            'response_format': 'bytes',
+        }
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/generate-audio', json=payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Server-Timing', response.headers)
+            self.assertIn('total;dur=', response.headers['Server-Timing'])
+            self.assertIn('tts;dur=', response.headers['Server-Timing'])
+
+    async def test_in_flight(self):
+        payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel.',
+            'voice': 'elon',
+            'response_format': 'stream',
+        }
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            for _ in range(2):
+                response = await c.post('/v2/generate-audio', json=payload)
+                self.assertEqual(response.status_code, 200)
+                await response.get_data()
+            self.assertEqual(Metrics.in_flight, 0)
+            response = await c.get('/metrics')
+            text = await response.get_data(as_text=True)
+            # Only the scrape itself
+            self.assertIn('openvoice_requests_in_flight 1', text)
+            self.assertIn('openvoice_requests_total{endpoint="generate_audio",status="200"} 2', text)
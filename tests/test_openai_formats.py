@@ -0,0 +1,40 @@
+import os, sys
+from unittest import IsolatedAsyncioTestCase
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app
+from models.Request import Request
+from models.Encoder import Encoder
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = app.test_client()
+        self.url = '/v2/audio/speech'
+        self.payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel, we might just have a deal.',
+            'voice': 'elon',
+        }
+
+    async def test_default_response_format(self):
+        args = dict(self.payload)
+        self.assertFalse(await Request.validate_generate_audio_request(args, 'v2', True))
+        self.assertEqual(args['response_format'], 'mp3')
+        args = dict(self.payload)
+        self.assertFalse(await Request.validate_generate_audio_request(args, 'v2'))
+        self.assertEqual(args['response_format'], 'url')
+
+    async def test_pcm_rate(self):
+        async with self.client as c:
+            response = await c.post(self.url, json=dict(self.payload, response_format='wav'))
+            self.assertEqual(response.status_code, 200)
+            wav = await response.get_data()
+            response = await c.post(self.url, json=dict(self.payload, response_format='pcm'))
+            self.assertEqual(response.status_code, 200)
+            pcm = await response.get_data()
+        sampling_rate = int.from_bytes(wav[24:28], 'little')
+        duration = (len(wav) - 44) / 2 / sampling_rate
+        self.assertNotEqual(sampling_rate, Encoder.pcm_rate)
+        self.assertAlmostEqual(len(pcm) / 2 / Encoder.pcm_rate, duration, delta=0.01)
@@ -0,0 +1,39 @@
+import os, sys, logging
+from unittest import IsolatedAsyncioTestCase, mock
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import stubs
+from models.Precision import Precision
+from models.Embedding import Embedding
+
+class Converter(torch.nn.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.ref_enc = torch.nn.Linear(8, 8)
+        self.dec = torch.nn.Linear(8, 8)
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def test_quantize_keeps_modules(self):
+        module = Converter()
+        quantized = Precision.quantize(module, keep=('ref_enc',))
+        self.assertIs(quantized.ref_enc, module.ref_enc)
+        self.assertIsInstance(quantized.ref_enc.weight, torch.nn.Parameter)
+        self.assertNotIsInstance(quantized.dec, torch.nn.Linear)
+
+    async def test_target_se_in_fp32(self):
+        # Extracted in the inference pool of a bf16 converter, as a voice registered at runtime
+        converter = stubs.ToneColorConverter(None)
+        autocast = []
+
+        def get_se(audio_path, vc_model, target_dir='processed', vad=True):
+            autocast.append(torch.is_autocast_cpu_enabled())
+            return torch.zeros(1, stubs.GIN_CHANNELS, 1), os.path.basename(audio_path)
+
+        with mock.patch.dict(Precision.active, {'converter_test': ('bf16', 'cpu')}), mock.patch.object(sys.modules['openvoice.se_extractor'], 'get_se', get_se):
+            Precision.call('converter_test', Embedding.get_target_se, logging.getLogger(__name__), f'{os.path.dirname(os.path.abspath(__file__))}/speakers/rachel.mp3', converter, 'test', False, f"{os.environ['SE_CACHE_PATH']}/test")
+
+        self.assertEqual(autocast, [False])
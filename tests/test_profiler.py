@@ -0,0 +1,37 @@
+import os, sys
+from unittest import IsolatedAsyncioTestCase
+
+os.environ['PROFILE_TOKEN'] = os.getenv("PROFILE_TOKEN", 'test-profile-token')
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_backend import app
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel.',
+            'voice': 'elon',
+            'response_format': 'bytes',
+        }
+
+    async def test_profiled_request(self):
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/generate-audio', json=self.payload, headers={'X-Profile-Token': os.environ['PROFILE_TOKEN']})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('X-Profile-Id', response.headers)
+            files = response.headers['X-Profile-Files'].split(', ')
+            pstats = [file for file in files if file.endswith('.pstats')]
+            self.assertTrue(pstats)
+            for file in pstats:
+                self.assertTrue(os.path.isfile(f"{os.environ['PROFILE_PATH']}/{file}"))
+
+    async def test_wrong_token(self):
+        async with app.test_app() as test_app:
+            c = test_app.test_client()
+            response = await c.post('/v2/generate-audio', json=self.payload, headers={'X-Profile-Token': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('X-Profile-Id', response.headers)
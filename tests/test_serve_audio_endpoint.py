@@ -65,6 +65,28 @@ try:
             print(f' > Error getting file bytes: {response.status_code}')
             print(response.json())
 
+        print(' > Getting range...')
+        response = requests.get(file_url, headers={'Range': 'bytes=0-1023'})
+        if response.status_code == 206 and len(response.content) == 1024:
+            print(f' > Range response: {response.headers["Content-Range"]}')
+        else:
+            print(f' > Error getting file range: {response.status_code}')
+
+        print(' > Getting conditional...')
+        etag = response.headers.get('ETag')
+        response = requests.get(file_url, headers={'If-None-Match': etag})
+        if response.status_code == 304:
+            print(f' > Not modified for etag {etag}')
+        else:
+            print(f' > Error getting conditional file: {response.status_code}')
+
+        print(' > Getting head...')
+        response = requests.head(file_url)
+        if response.status_code == 200 and not response.content:
+            print(f' > Head content length: {response.headers["Content-Length"]}')
+        else:
+            print(f' > Error getting file head: {response.status_code}')
+
 except requests.exceptions.RequestException as e:
     print(f'Request failed: {e}')
 
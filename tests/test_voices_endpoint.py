@@ -0,0 +1,76 @@
+import os, sys, base64
+from unittest import IsolatedAsyncioTestCase
+from dotenv import load_dotenv
+
+load_dotenv()
+
+os.environ['LOG_LEVEL'] = os.getenv("LOG_LEVEL", "DEBUG")
+os.environ['SERVER_ADDRESS'] = os.getenv("SERVER_ADDRESS", "0.0.0.0")
+os.environ['SERVER_PORT'] = os.getenv("SERVER_PORT", 5000)
+os.environ['AUDIO_FILES_PATH'] = os.getenv("AUDIO_FILES_PATH", '/tmp')
+os.environ['MODEL_LANGUAGES_V1'] = os.getenv("MODEL_LANGUAGES_V1", "EN:English,ZH:Chinese")
+os.environ['MODEL_LANGUAGES_V2'] = os.getenv("MODEL_LANGUAGES_V2", "EN,ES,FR,ZH,JP")
+os.environ['SPEAKERS_FOLDER'] = os.getenv("SPEAKERS_FOLDER", "speakers")
+os.environ['SPEAKERS'] = os.getenv("SPEAKERS", "elon,rachel,kaiwen")
+os.environ['WATERMARK'] = os.getenv("WATERMARK", "@OpenVoiceAPI")
+os.environ['DEVICE_V1'] = os.getenv("DEVICE_V1", "cuda:0")
+os.environ['DEVICE_V2'] = os.getenv("DEVICE_V2", "cuda:0")
+os.environ['SUPPORTED_STYLES_V1'] = os.getenv("SUPPORTED_STYLES_V1", "English")
+os.environ['USE_VAD'] = os.getenv("USE_VAD", False)
+os.environ['ADMIN_TOKEN'] = os.getenv("ADMIN_TOKEN", 'test-admin-token')
+os.environ['VOICES_PATH'] = os.getenv("VOICES_PATH", '/tmp/openvoice-test-voices')
+os.environ['SPEAKER_STORE_PATH'] = os.getenv("SPEAKER_STORE_PATH", '/tmp/openvoice-test-voices/store')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+
+from app import app
+
+class Test(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.client = app.test_client()
+        self.url = '/admin/voices'
+        self.headers = {'X-Admin-Token': os.environ['ADMIN_TOKEN']}
+
+    async def test_register_and_delete(self):
+        with open('speakers/rachel.mp3', 'rb') as f:
+            audio_bytes = f.read()
+        async with self.client as c:
+            response = await c.delete(f'{self.url}/anna', headers=self.headers)
+            response = await c.post(self.url, data=audio_bytes, query_string={'name': 'anna'}, headers=dict(self.headers, **{'Content-Type': 'audio/mpeg'}))
+            self.assertEqual(response.status_code, 201)
+            response = await c.get(self.url, headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            response_data = await response.get_json()
+            self.assertIn('anna', [voice['name'] for voice in response_data['result']['data']['voices']])
+        payload = {
+            'model': 'en',
+            'input': 'Let me know how you feel, we might just have a deal.',
+            'voice': 'anna',
+            'response_format': 'bytes'
+        }
+        async with self.client as c:
+            response = await c.post('/v2/generate-audio', json=payload)
+            self.assertEqual(response.status_code, 200)
+            response = await c.delete(f'{self.url}/anna', headers=self.headers)
+            self.assertEqual(response.status_code, 200)
+            response = await c.post('/v2/generate-audio', json=payload)
+            self.assertEqual(response.status_code, 400)
+
+    async def test_params_errors(self):
+        async with self.client as c:
+            # token required
+            response = await c.get(self.url)
+            self.assertEqual(response.status_code, 401)
+            # invalid name
+            response = await c.post(self.url, json={'name': 'Not valid!', 'audio_data': ''}, headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+            # existing voice
+            response = await c.post(self.url, json={'name': 'elon', 'audio_data': ''}, headers=self.headers)
+            self.assertEqual(response.status_code, 409)
+            # voices set in SPEAKERS cannot be deleted
+            response = await c.delete(f'{self.url}/elon', headers=self.headers)
+            self.assertEqual(response.status_code, 400)
+            # unknown voice
+            response = await c.delete(f'{self.url}/unknown', headers=self.headers)
+            self.assertEqual(response.status_code, 404)